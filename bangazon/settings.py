@@ -53,8 +53,10 @@ REST_FRAMEWORK = {
     'DEFAULT_RENDERER_CLASSES': (
         'rest_framework.renderers.JSONRenderer',
     ),
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
-    'PAGE_SIZE': 10
+    'DEFAULT_PAGINATION_CLASS': 'bangazonapi.pagination.KeysetPagination',
+    'PAGE_SIZE': 10,
+    # Prices are decimals in the database but stay JSON numbers
+    'COERCE_DECIMAL_TO_STRING': False,
 }
 
 MIDDLEWARE = [
@@ -101,12 +103,32 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
-
+        # A file, not shared-cache memory: the checkout concurrency tests
+        # (tests.order.CheckoutConcurrencyTests) write from several threads,
+        # which must wait on SQLite's busy timeout instead of failing with
+        # "table is locked". Django deletes it after the run.
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 DEFAULT_AUTO_FIELD = 'django.db.models.AutoField'
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bangazon',
+    }
+}
+
+# Local-memory caches are per process. Cached categories are keyed on the
+# database-backed TableVersion, so writes made by another process are seen
+# on the next read and stale entries simply expire.
+PRODUCT_CATEGORY_CACHE_TIMEOUT = 60 * 60
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -138,3 +160,17 @@ APPEND_SLASH = False
 
 MEDIA_ROOT = 'media'
 MEDIA_URL = '/media/'
+
+# Media is served by bangazonapi.views.media.serve_media. Set
+# MEDIA_SENDFILE_HEADER to 'X-Sendfile' (Apache, lighttpd) or
+# 'X-Accel-Redirect' (nginx, with an internal location at
+# MEDIA_ACCEL_REDIRECT_PREFIX) to let the front proxy send the file body.
+MEDIA_CACHE_MAX_AGE = 60 * 60 * 24 * 30
+MEDIA_SENDFILE_HEADER = None
+MEDIA_ACCEL_REDIRECT_PREFIX = '/protected-media/'
+
+# Uploaded product images are decoded and cleaned on a background thread
+# pool, see bangazonapi/images.py. 0 workers processes them inline.
+PRODUCT_IMAGE_WORKERS = 2
+PRODUCT_IMAGE_MAX_BYTES = 10 * 1024 * 1024
+PRODUCT_IMAGE_MAX_PIXELS = 25_000_000
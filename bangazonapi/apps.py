@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class BangazonapiConfig(AppConfig):
     name = 'bangazonapi'
+
+    def ready(self):
+        from . import signals  # pylint: disable=unused-import,import-outside-toplevel
@@ -0,0 +1,71 @@
+"""Conditional GET (ETag / Last-Modified) support for ViewSet methods"""
+import functools
+import hashlib
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+from bangazonapi.models import TableVersion
+
+
+def conditional(validators):
+    """Answer GET requests with 304 Not Modified when the client is current
+
+    `validators(view, request, *args, **kwargs)` must return an
+    `(etag, last_modified)` pair cheaply, without serializing anything, or
+    None when no validators apply. `If-None-Match` and `If-Modified-Since`
+    are checked before the view method runs, and the validators are sent
+    back on successful responses, with `Vary: Accept` when the view can
+    render more than one format.
+
+    Arguments:
+        validators {callable} -- Computes the validators for a request
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(view, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return method(view, request, *args, **kwargs)
+
+            current = validators(view, request, *args, **kwargs)
+            if current is None:
+                return method(view, request, *args, **kwargs)
+
+            etag, last_modified = current
+            etag = quote_etag(etag) if etag else None
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(
+                request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = method(view, request, *args, **kwargs)
+
+            if response.status_code in (200, 304):
+                if etag and not response.has_header('ETag'):
+                    response.headers['ETag'] = etag
+                if timestamp and not response.has_header('Last-Modified'):
+                    response.headers['Last-Modified'] = http_date(timestamp)
+                if len(view.renderer_classes) > 1:
+                    patch_vary_headers(response, ('Accept',))
+            return response
+        return wrapper
+    return decorator
+
+
+def representation(request):
+    """The request's full path and negotiated media type, which an ETag
+    must cover so JSON and NDJSON responses for a URL get different tags"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    return f'{request.get_full_path()}|{getattr(renderer, "media_type", "")}'
+
+
+def table_validators(*tables):
+    """Validators for a listing built from the named tables
+
+    The ETag combines the tables' change counters with the request path
+    and media type, so each filter, page and format has its own tag.
+    """
+    def validators(view, request, *args, **kwargs):
+        versions, last_modified = TableVersion.current(*tables)
+        digest = hashlib.sha1(
+            f'{versions}|{representation(request)}'.encode('utf-8')).hexdigest()
+        return digest, last_modified
+    return validators
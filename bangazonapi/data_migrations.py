@@ -0,0 +1,45 @@
+"""Data migrations that generated schema migrations must run
+
+Migrations are generated by `makemigrations` rather than written by hand,
+so data changes a schema change depends on are kept here and spliced into
+the generated migration, right before the operation that needs them, by
+the app's `makemigrations` command.
+"""
+from django.db import migrations
+from django.db.models import Count, Min, Sum
+
+
+def fold_duplicate_line_items(apps, schema_editor):
+    """Merge line items for the same product on the same order into one
+    row whose quantity is the total, so one-per-product can be enforced
+
+    The quantities sold per product do not change, so the product counters
+    stay correct. Order totals are refreshed by `rebuild_order_totals`.
+    """
+    OrderProduct = apps.get_model('bangazonapi', 'OrderProduct')
+    line_items = OrderProduct.objects.using(schema_editor.connection.alias)
+
+    duplicates = line_items.order_by().values('order_id', 'product_id').annotate(
+        rows=Count('id'), total=Sum('quantity'), keep=Min('id')).filter(rows__gt=1)
+    for group in list(duplicates):
+        line_items.filter(pk=group['keep']).update(quantity=group['total'])
+        line_items.filter(order_id=group['order_id'], product_id=group['product_id']) \
+            .exclude(pk=group['keep']).delete()
+
+
+# Constraint name -> data migration that must run before it is added
+BEFORE_CONSTRAINT = {
+    'orderproduct_one_per_product': fold_duplicate_line_items,
+}
+
+
+def add_data_migrations(migration):
+    """Insert the data migrations the operations of a generated migration need"""
+    operations = []
+    for operation in migration.operations:
+        if isinstance(operation, migrations.AddConstraint) \
+                and operation.constraint.name in BEFORE_CONSTRAINT:
+            operations.append(migrations.RunPython(
+                BEFORE_CONSTRAINT[operation.constraint.name], migrations.RunPython.noop))
+        operations.append(operation)
+    migration.operations = operations
@@ -0,0 +1,338 @@
+"""Background processing of uploaded product images
+
+Uploads arrive as base64 data URIs. Views save the product row with
+`image_status = pending` and hand the payload to `submit_product_image()`.
+After the transaction commits, a worker thread decodes it in chunks,
+checks it with Pillow, re-encodes it without metadata, writes it to media
+storage and marks the product `ready` (or `failed`, with a reason).
+
+Cleaned images are stored by content, as `products/<sha256>.<ext>`, so
+products with the same picture share one file and one set of variants.
+Files are never deleted when a product goes away. Once no product row
+(soft-deleted rows included) references an image, `manage.py
+collect_product_images` removes it and its variants.
+
+Each stored image also gets downscaled WebP variants, one per size in
+`VARIANT_SIZES`, under `products/variants/`. The sizes that were written
+are recorded in `Product.image_variant_sizes`, so reads never probe
+storage. Products created with a reference to an image already in
+storage get its missing variants generated in the background, and
+`manage.py generate_product_image_variants` backfills every image.
+Whenever the recorded sizes change, the product's `modified_date` and
+the `product` table version move with them.
+
+Uploads are only held in memory until they are processed, so products
+left `pending` by a worker or process that died are never picked up
+again. `manage.py fail_stale_product_images` marks them `failed`, asking
+for the image to be uploaded again, and is meant to run periodically.
+
+Set `PRODUCT_IMAGE_WORKERS = 0` to process images inline, e.g. in tests.
+"""
+import base64
+import binascii
+import hashlib
+import io
+import logging
+import os
+import re
+import tempfile
+import threading
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps
+from bangazonapi.models import Product, TableVersion
+
+logger = logging.getLogger(__name__)
+
+IMAGE_DATA_URI = re.compile(r'^data:image/(?P<ext>[a-z0-9.+-]+);base64,', re.IGNORECASE)
+
+# Pillow format name -> file extension
+ALLOWED_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'GIF': 'gif', 'WEBP': 'webp'}
+
+# Multiple of 4 so every chunk decodes on its own
+DECODE_CHUNK_SIZE = 64 * 1024
+
+# Originals live directly in this directory, variants in VARIANT_DIRECTORY
+IMAGE_DIRECTORY = 'products'
+
+# Longest edge, in pixels, of the generated variants
+VARIANT_SIZES = (128, 256, 512)
+VARIANT_DIRECTORY = f'{IMAGE_DIRECTORY}/variants'
+VARIANT_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+# Images whose variants are being generated, so each is queued once
+_pending_variants = set()
+_pending_variants_lock = threading.Lock()
+
+
+class ImageRejected(Exception):
+    """The upload is not an image we are willing to store"""
+
+
+def submit_product_image(product_id, data_uri):
+    """Queue a base64 data URI to become the image of a product once the
+    current transaction commits"""
+    transaction.on_commit(lambda: _dispatch(product_id, data_uri))
+
+
+def _dispatch(product_id, data_uri):
+    if settings.PRODUCT_IMAGE_WORKERS <= 0:
+        process_product_image(product_id, data_uri)
+        return
+    _get_executor().submit(_run_in_worker, process_product_image, product_id, data_uri)
+
+
+def _get_executor():
+    global _executor  # pylint: disable=global-statement
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PRODUCT_IMAGE_WORKERS, thread_name_prefix='product-image')
+        return _executor
+
+
+def _run_in_worker(job, *args):
+    close_old_connections()
+    try:
+        job(*args)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception('Image job %s%r failed', job.__name__, args)
+    finally:
+        close_old_connections()
+
+
+def process_product_image(product_id, data_uri):
+    """Decode, validate, clean and store the image for one product"""
+    if not Product.all_objects.filter(pk=product_id).exists():
+        return
+
+    try:
+        content, extension = clean_image(data_uri)
+    except ImageRejected as ex:
+        Product.all_objects.filter(pk=product_id).update(
+            image_status=Product.IMAGE_FAILED, image_error=str(ex)[:255],
+            modified_date=timezone.now())
+        TableVersion.bump('product')
+        return
+
+    name = f'{IMAGE_DIRECTORY}/{hashlib.sha256(content.read()).hexdigest()}.{extension}'
+    content.seek(0)
+    if default_storage.exists(name):
+        # Restart the collector's grace period for a file it may have found unreferenced
+        touch(name, *(variant_name(name, size) for size in VARIANT_SIZES))
+    else:
+        name = default_storage.save(name, content)
+
+    try:
+        generate_variants(name, overwrite=False)
+    except OSError:
+        # Left to generate_product_image_variants, no reason to fail the upload
+        logger.exception('Generating the variants of %s failed', name)
+    Product.all_objects.filter(pk=product_id).update(
+        image_path=name, image_status=Product.IMAGE_READY, image_error='',
+        image_variant_sizes=existing_variant_sizes(name), modified_date=timezone.now())
+    TableVersion.bump('product')
+
+
+def clean_image(data_uri):
+    """Turn a base64 data URI into a metadata-free image file
+
+    Returns:
+        tuple -- (ContentFile, file extension)
+
+    Raises:
+        ImageRejected -- The payload is malformed, too large or not a supported image
+    """
+    match = IMAGE_DATA_URI.match(data_uri or '')
+    if match is None:
+        raise ImageRejected('Expected a base64 data URI such as data:image/png;base64,...')
+
+    with tempfile.TemporaryFile() as decoded:
+        _decode_in_chunks(data_uri, match.end(), decoded)
+        decoded.seek(0)
+
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', Image.DecompressionBombWarning)
+            try:
+                with Image.open(decoded) as image:
+                    image.verify()
+                decoded.seek(0)
+                with Image.open(decoded) as image:
+                    image_format = image.format
+                    if image_format not in ALLOWED_FORMATS:
+                        raise ImageRejected(f'Unsupported image format {image_format}')
+                    if image.width * image.height > settings.PRODUCT_IMAGE_MAX_PIXELS:
+                        raise ImageRejected('Image dimensions are too large')
+
+                    # Apply the EXIF orientation, then write only the pixels
+                    cleaned = ImageOps.exif_transpose(image)
+                    output = io.BytesIO()
+                    cleaned.save(output, format=image_format)
+            except (Image.DecompressionBombError, Image.DecompressionBombWarning) as ex:
+                raise ImageRejected('Image dimensions are too large') from ex
+            except (OSError, SyntaxError, ValueError) as ex:
+                raise ImageRejected('The upload is not a readable image') from ex
+
+    return ContentFile(output.getvalue()), ALLOWED_FORMATS[image_format]
+
+
+def _decode_in_chunks(data_uri, start, target):
+    """Base64 decode `data_uri[start:]` into `target` a chunk at a time,
+    stopping once the decoded size passes PRODUCT_IMAGE_MAX_BYTES"""
+    written = 0
+    for offset in range(start, len(data_uri), DECODE_CHUNK_SIZE):
+        try:
+            chunk = base64.b64decode(data_uri[offset:offset + DECODE_CHUNK_SIZE], validate=True)
+        except (binascii.Error, ValueError) as ex:
+            raise ImageRejected('Invalid base64 image data') from ex
+
+        written += len(chunk)
+        if written > settings.PRODUCT_IMAGE_MAX_BYTES:
+            raise ImageRejected('Image file is too large')
+        target.write(chunk)
+
+
+def touch(*names):
+    """Set the modification time of stored files to now, skipping files
+    that are missing and storages without local paths"""
+    for name in names:
+        try:
+            os.utime(default_storage.path(name))
+        except (NotImplementedError, FileNotFoundError):
+            pass
+
+
+def referenced_images():
+    """Storage names of every image referenced by a product row, including
+    soft-deleted rows, which can still be undeleted"""
+    return set(Product.all_objects.exclude(image_path__isnull=True).exclude(image_path='')
+               .values_list('image_path', flat=True).distinct())
+
+
+def variant_prefix(image_name):
+    """File name prefix shared by the variants of `image_name`
+
+    The original's file name stem followed by a hash of its full storage
+    name, so `products/a/x.png` and `products/b/x.jpg` get separate variants.
+    """
+    stem = os.path.splitext(os.path.basename(image_name))[0]
+    return f'{stem}-{hashlib.sha256(image_name.encode("utf-8")).hexdigest()[:12]}'
+
+
+def variant_name(image_name, size):
+    """Storage name of the `size` pixel WebP variant of `image_name`"""
+    return f'{VARIANT_DIRECTORY}/{variant_prefix(image_name)}-{size}.webp'
+
+
+def variant_urls(image_name, sizes):
+    """URLs of the variants of `image_name`, keyed by size
+
+    Arguments:
+        sizes {list} -- Sizes recorded in `Product.image_variant_sizes`.
+            Storage is not checked, clients fall back to `image_path`
+            for sizes that are not listed
+
+    Returns:
+        dict -- e.g. {"128": "/media/products/variants/kite-3f2a9c01b7e4-128.webp", ...}
+    """
+    if not image_name:
+        return {}
+    return {str(size): default_storage.url(variant_name(image_name, size)) for size in sizes}
+
+
+def existing_variant_sizes(image_name):
+    """Sizes of the variants of `image_name` that are in storage"""
+    return [size for size in VARIANT_SIZES if default_storage.exists(variant_name(image_name, size))]
+
+
+def submit_product_variants(image_names):
+    """Queue the missing variants of already stored images to be generated
+    once the current transaction commits"""
+    image_names = {name for name in image_names if name}
+    if image_names:
+        transaction.on_commit(lambda: [_request_variants(name) for name in sorted(image_names)])
+
+
+def _request_variants(image_name):
+    with _pending_variants_lock:
+        if image_name in _pending_variants:
+            return
+        _pending_variants.add(image_name)
+
+    if settings.PRODUCT_IMAGE_WORKERS <= 0:
+        _refresh_pending_variants(image_name)
+        return
+    _get_executor().submit(_run_in_worker, _refresh_pending_variants, image_name)
+
+
+def _refresh_pending_variants(image_name):
+    try:
+        refresh_variants(image_name, overwrite=False)
+    finally:
+        with _pending_variants_lock:
+            _pending_variants.discard(image_name)
+
+
+def refresh_variants(image_name, overwrite=True):
+    """Write the variants of a stored image and record them on every
+    product that uses it
+
+    Arguments:
+        image_name {str} -- Storage name of the original image
+        overwrite {bool} -- Replace variants that already exist
+
+    Returns:
+        list -- Storage names of the variants that were written
+    """
+    written = generate_variants(image_name, overwrite=overwrite)
+
+    sizes = existing_variant_sizes(image_name)
+    updated = Product.all_objects.filter(image_path=image_name).exclude(
+        image_variant_sizes=sizes).update(image_variant_sizes=sizes, modified_date=timezone.now())
+    if updated:
+        TableVersion.bump('product')
+    return written
+
+
+def generate_variants(image_name, overwrite=True):
+    """Write the WebP variants of a stored image
+
+    Arguments:
+        image_name {str} -- Storage name of the original image
+        overwrite {bool} -- Replace variants that already exist
+
+    Returns:
+        list -- Storage names of the variants that were written
+    """
+    if not default_storage.exists(image_name):
+        return []
+
+    sizes = [size for size in VARIANT_SIZES
+             if overwrite or not default_storage.exists(variant_name(image_name, size))]
+    if not sizes:
+        return []
+
+    written = []
+    with default_storage.open(image_name, 'rb') as original, Image.open(original) as image:
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+        for size in sorted(sizes, reverse=True):
+            # Downscale from the previous (larger) variant, never upscale
+            image.thumbnail((size, size), Image.Resampling.LANCZOS)
+            output = io.BytesIO()
+            image.save(output, format='WEBP', quality=VARIANT_QUALITY, method=4)
+
+            name = variant_name(image_name, size)
+            if default_storage.exists(name):
+                default_storage.delete(name)
+            written.append(default_storage.save(name, ContentFile(output.getvalue())))
+    return written
@@ -0,0 +1,23 @@
+"""Management command to refresh the query planner statistics"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+
+class Command(BaseCommand):
+    help = ('Run ANALYZE so the query planner knows how selective each index is. '
+            'SQLite only picks the partial indexes on `deleted IS NULL` over the plain '
+            '`deleted` index once it has statistics. Run it after loading data.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to analyze')
+
+    def handle(self, *args, **options):
+        connection = connections[options['database']]
+        if connection.vendor not in ('sqlite', 'postgresql'):
+            raise CommandError(f'ANALYZE is not supported on {connection.vendor}')
+
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(f'Analyzed {options["database"]} database'))
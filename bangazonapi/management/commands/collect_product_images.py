@@ -0,0 +1,82 @@
+"""Management command to delete product images no product references"""
+import datetime
+import os
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from bangazonapi.images import IMAGE_DIRECTORY, VARIANT_DIRECTORY, VARIANT_SIZES, referenced_images, variant_prefix
+from bangazonapi.models import Product
+
+
+class Command(BaseCommand):
+    help = ('Delete product images, and their variants, that no product row references. '
+            'Soft-deleted products keep their images until they are purged.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only list the files that would be deleted')
+        parser.add_argument(
+            '--grace-minutes', type=int, default=60,
+            help='Keep files newer than this, so uploads still being processed are not collected')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(minutes=options['grace_minutes'])
+        referenced = referenced_images()
+        live_prefixes = {variant_prefix(name) for name in referenced}
+
+        candidates = []
+        for filename in _files(IMAGE_DIRECTORY):
+            name = f'{IMAGE_DIRECTORY}/{filename}'
+            if name not in referenced:
+                candidates.append(name)
+
+        for filename in _files(VARIANT_DIRECTORY):
+            if _variant_prefix(filename) not in live_prefixes:
+                candidates.append(f'{VARIANT_DIRECTORY}/{filename}')
+
+        deleted = 0
+        for name in candidates:
+            if default_storage.get_modified_time(name) > cutoff:
+                continue
+            # An upload may have reused the file since the scan
+            if _is_referenced(name):
+                continue
+            self.stdout.write(name)
+            if not options['dry_run']:
+                default_storage.delete(name)
+            deleted += 1
+
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {deleted} unreferenced files, {len(referenced)} images are in use'))
+
+
+def _is_referenced(name):
+    """Whether a product references the image, or the original of the variant, `name`"""
+    if name.startswith(f'{VARIANT_DIRECTORY}/'):
+        prefix = _variant_prefix(os.path.basename(name))
+        if prefix is None:
+            return False
+        # Narrow down by the original's file name, then compare the full prefix
+        stem = prefix.rpartition('-')[0]
+        images = Product.all_objects.filter(image_path__contains=stem) \
+            .values_list('image_path', flat=True).distinct()
+        return any(variant_prefix(image) == prefix for image in images.iterator())
+    return Product.all_objects.filter(image_path=name).exists()
+
+
+def _files(directory):
+    if not default_storage.exists(directory):
+        return []
+    return default_storage.listdir(directory)[1]
+
+
+def _variant_prefix(filename):
+    """`kite-3f2a9c01b7e4-256.webp` -> `kite-3f2a9c01b7e4`, or None for files
+    that are not variants"""
+    stem, extension = os.path.splitext(filename)
+    stem, _, size = stem.rpartition('-')
+    if extension != '.webp' or not size.isdigit() or int(size) not in VARIANT_SIZES:
+        return None
+    return stem
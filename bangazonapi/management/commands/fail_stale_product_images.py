@@ -0,0 +1,41 @@
+"""Management command to fail product images stuck in processing"""
+import datetime
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from bangazonapi.models import Product, TableVersion
+
+STALE_IMAGE_ERROR = 'Processing was interrupted, upload the image again'
+
+
+class Command(BaseCommand):
+    help = ('Mark product images that have been pending for too long as failed. Uploads '
+            'are only held in memory while they are processed, so a worker or process that '
+            'died cannot be resumed and the image has to be uploaded again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only list the stuck products')
+        parser.add_argument(
+            '--older-than-minutes', type=int, default=30,
+            help='Only fail images that have been pending at least this long')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - datetime.timedelta(minutes=options['older_than_minutes'])
+        stale = Product.all_objects.filter(
+            image_status=Product.IMAGE_PENDING, modified_date__lte=cutoff)
+
+        for product_id in stale.values_list('id', flat=True):
+            self.stdout.write(f'Product {product_id}')
+
+        if options['dry_run']:
+            count = stale.count()
+        else:
+            count = stale.update(
+                image_status=Product.IMAGE_FAILED, image_error=STALE_IMAGE_ERROR,
+                modified_date=timezone.now())
+            if count:
+                TableVersion.bump('product')
+
+        verb = 'Found' if options['dry_run'] else 'Failed'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {count} stuck product images'))
@@ -0,0 +1,30 @@
+"""Management command to backfill the WebP variants of product images"""
+from django.core.management.base import BaseCommand
+from bangazonapi.images import VARIANT_SIZES, refresh_variants
+from bangazonapi.models import Product
+
+
+class Command(BaseCommand):
+    help = (f'Generate the {"/".join(map(str, VARIANT_SIZES))}px WebP variants of every product image '
+            'and record them on the products that use it')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Regenerate variants that already exist')
+
+    def handle(self, *args, **options):
+        images = (Product.all_objects.exclude(image_path__isnull=True).exclude(image_path='')
+                  .order_by('image_path').values_list('image_path', flat=True).distinct())
+
+        checked = written = failed = 0
+        for image_name in images.iterator():
+            checked += 1
+            try:
+                written += len(refresh_variants(image_name, overwrite=options['force']))
+            except OSError as ex:
+                failed += 1
+                self.stderr.write(f'{image_name}: {ex}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} images, wrote {written} variants, {failed} failed'))
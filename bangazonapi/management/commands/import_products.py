@@ -0,0 +1,203 @@
+"""Management command to import a product catalog from CSV or NDJSON"""
+import csv
+import gzip
+import json
+import sys
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework import serializers
+from bangazonapi.images import IMAGE_DATA_URI, submit_product_variants
+from bangazonapi.models import Customer, Product, ProductCategory
+from bangazonapi.views.product import BulkProductSerializer
+
+# Rejected rows echoed to stderr when no --rejects file is given
+SHOWN_REJECTS = 10
+
+
+class ImportProductSerializer(BulkProductSerializer):
+    """One row of an import file
+
+    The category is given by `category_id` or by `category` name, and the
+    seller by `customer_id` or by `customer` username. Images must already
+    be in media storage.
+    """
+    category_id = serializers.IntegerField(required=False)
+    category = serializers.CharField(required=False)
+    customer_id = serializers.IntegerField(required=False)
+    customer = serializers.CharField(required=False)
+
+    def validate_image_path(self, value):
+        if value and IMAGE_DATA_URI.match(value):
+            raise serializers.ValidationError('Imported images must be paths in media storage')
+        return super().validate_image_path(value)
+
+
+class Command(BaseCommand):
+    help = ('Stream products from a CSV or NDJSON file (optionally gzipped) into the '
+            'database in batches, reporting throughput and rejected rows')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='File to import, or - for stdin')
+        parser.add_argument(
+            '--format', choices=('csv', 'ndjson'),
+            help='File format, guessed from the file extension by default')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of products inserted per transaction')
+        parser.add_argument(
+            '--rejects',
+            help='Write rejected rows, with their errors, to this NDJSON file')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Validate every row without inserting anything')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or _guess_format(path)
+        if file_format is None:
+            raise CommandError('Cannot tell the file format from its name, use --format')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        # Lookup maps are sized by customers and categories, not by the import
+        categories = dict(ProductCategory.objects.values_list('id', 'id'))
+        categories.update(
+            (name.lower(), pk) for pk, name in ProductCategory.objects.values_list('id', 'name'))
+        customers = dict(Customer.objects.values_list('id', 'id'))
+        customers.update(Customer.objects.values_list('user__username', 'id'))
+
+        # One serializer validates every row, binding its fields once
+        self.serializer = ImportProductSerializer()
+
+        rejects = open(options['rejects'], 'w', encoding='utf-8') if options['rejects'] else None
+        imported = rejected = 0
+        started = time.monotonic()
+        try:
+            with _open(path) as source:
+                batch = []
+                for line, row, errors in _rows(source, file_format):
+                    product = None
+                    if errors is None:
+                        product, errors = self.build_product(row, categories, customers)
+                    if errors:
+                        rejected += 1
+                        self.reject(rejects, rejected, line, row, errors)
+                        continue
+
+                    batch.append(product)
+                    if len(batch) == options['batch_size']:
+                        imported += self.insert(batch, options['dry_run'])
+                        batch = []
+                        if options['verbosity'] >= 2:
+                            self.progress(imported, rejected, started)
+
+                imported += self.insert(batch, options['dry_run'])
+        finally:
+            if rejects is not None:
+                rejects.close()
+
+        elapsed = max(time.monotonic() - started, 0.001)
+        verb = 'Validated' if options['dry_run'] else 'Imported'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {imported} products, rejected {rejected} rows, '
+            f'in {elapsed:.1f}s ({(imported + rejected) / elapsed:,.0f} rows/sec)'))
+
+    def build_product(self, row, categories, customers):
+        """Validate one row
+
+        Returns:
+            tuple -- (unsaved Product, None) or (None, errors)
+        """
+        try:
+            data = self.serializer.run_validation(row)
+        except serializers.ValidationError as ex:
+            return None, ex.detail
+
+        errors = {}
+        category_id = _lookup(categories, data, 'category_id', 'category')
+        if category_id is None:
+            errors['category'] = ['Category does not exist']
+        customer_id = _lookup(customers, data, 'customer_id', 'customer')
+        if customer_id is None:
+            errors['customer'] = ['Customer does not exist']
+        if errors:
+            return None, errors
+
+        return Product(
+            name=data['name'], price=data['price'], description=data['description'],
+            quantity=data['quantity'], location=data['location'],
+            image_path=data.get('image_path', None),
+            category_id=category_id, customer_id=customer_id), None
+
+    def insert(self, batch, dry_run):
+        if not batch or dry_run:
+            return len(batch)
+        with transaction.atomic():
+            Product.objects.bulk_create(batch)
+            submit_product_variants(product.image_path.name for product in batch if product.image_path)
+        return len(batch)
+
+    def reject(self, rejects, count, line, row, errors):
+        if rejects is not None:
+            rejects.write(json.dumps({'line': line, 'row': row, 'errors': errors}) + '\n')
+        elif count <= SHOWN_REJECTS:
+            self.stderr.write(f'Line {line}: {json.dumps(errors)}')
+
+    def progress(self, imported, rejected, started):
+        elapsed = max(time.monotonic() - started, 0.001)
+        self.stdout.write(
+            f'{imported} imported, {rejected} rejected, {(imported + rejected) / elapsed:,.0f} rows/sec')
+
+
+def _guess_format(path):
+    name = path[:-len('.gz')] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return None
+
+
+def _open(path):
+    if path == '-':
+        return open(sys.stdin.fileno(), 'r', encoding='utf-8', newline='', closefd=False)
+    try:
+        if path.endswith('.gz'):
+            return gzip.open(path, 'rt', encoding='utf-8', newline='')
+        return open(path, 'r', encoding='utf-8', newline='')
+    except OSError as ex:
+        raise CommandError(f'Cannot read {path}: {ex}') from ex
+
+
+def _rows(source, file_format):
+    """Yield (line number, row, parse errors) one row in memory at a time"""
+    if file_format == 'csv':
+        reader = csv.DictReader(source)
+        for row in reader:
+            # Empty cells are missing values, not empty strings
+            yield reader.line_num, {key: value for key, value in row.items() if value != ''}, None
+        return
+
+    for line, text in enumerate(source, start=1):
+        text = text.strip()
+        if not text:
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as ex:
+            yield line, text, {'non_field_errors': [f'Invalid JSON - {ex}']}
+            continue
+        if not isinstance(row, dict):
+            yield line, text, {'non_field_errors': ['Expected a JSON object']}
+            continue
+        yield line, row, None
+
+
+def _lookup(lookup, data, id_field, name_field):
+    if id_field in data:
+        return lookup.get(data[id_field], None)
+    if name_field in data:
+        key = data[name_field]
+        return lookup.get(key.lower() if name_field == 'category' else key, None)
+    return None
@@ -0,0 +1,11 @@
+"""makemigrations that adds the data migrations in bangazonapi.data_migrations"""
+from django.core.management.commands import makemigrations
+from bangazonapi.data_migrations import add_data_migrations
+
+
+class Command(makemigrations.Command):
+
+    def write_migration_files(self, changes, *args, **kwargs):
+        for migration in changes.get('bangazonapi', []):
+            add_data_migrations(migration)
+        super().write_migration_files(changes, *args, **kwargs)
@@ -0,0 +1,59 @@
+"""Management command to rebuild the denormalized order totals"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+from django.utils import timezone
+from bangazonapi.models import Order, OrderProduct, Product
+
+
+class Command(BaseCommand):
+    help = ('Fill in missing line item unit prices from the current product prices, then '
+            'recompute Order.subtotal and item_count from the line items and report drift')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report drifted orders, do not write anything')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of orders written per UPDATE batch')
+
+    def handle(self, *args, **options):
+        unpriced = OrderProduct.objects.filter(unit_price__isnull=True)
+        if options['dry_run']:
+            filled = unpriced.count()
+        else:
+            # The best guess for line items from before price snapshots
+            filled = unpriced.update(
+                unit_price=Subquery(Product.all_objects.filter(pk=OuterRef('product_id')).values('price')),
+                modified_date=timezone.now())
+
+        orders = Order.objects.with_computed_totals().only(
+            'id', 'subtotal', 'item_count', 'modified_date').order_by('id')
+
+        drifted = []
+        checked = 0
+        now = timezone.now()
+        for order in orders.iterator(chunk_size=options['batch_size']):
+            checked += 1
+            actual = (order.computed_subtotal, order.computed_item_count)
+            stored = (order.subtotal, order.item_count)
+
+            if actual != stored:
+                self.stdout.write(
+                    f'Order {order.id}: subtotal {stored[0]} -> {actual[0]}, '
+                    f'item_count {stored[1]} -> {actual[1]}')
+                order.subtotal, order.item_count = actual
+                order.modified_date = now
+                drifted.append(order)
+
+        if drifted and not options['dry_run']:
+            with transaction.atomic():
+                Order.objects.bulk_update(
+                    drifted, ['subtotal', 'item_count', 'modified_date'],
+                    batch_size=options['batch_size'])
+
+        verb = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Priced {filled} line items without a unit price. '
+            f'Checked {checked} orders, {verb} {len(drifted)} with drifted totals'))
@@ -0,0 +1,51 @@
+"""Management command to rebuild the denormalized product counters"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from bangazonapi.models import Product, TableVersion
+
+
+class Command(BaseCommand):
+    help = 'Recompute Product.units_sold, rating_count and rating_sum from scratch and report drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report drifted products, do not write the corrected counters')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of products written per UPDATE batch')
+
+    def handle(self, *args, **options):
+        products = Product.all_objects.all().with_computed_counters().only(
+            'id', 'units_sold', 'rating_count', 'rating_sum', 'modified_date').order_by('id')
+
+        drifted = []
+        checked = 0
+        now = timezone.now()
+        for product in products.iterator(chunk_size=options['batch_size']):
+            checked += 1
+            actual = (product.computed_units_sold,
+                      product.computed_rating_count,
+                      product.computed_rating_sum)
+            stored = (product.units_sold, product.rating_count, product.rating_sum)
+
+            if actual != stored:
+                self.stdout.write(
+                    f'Product {product.id}: units_sold {stored[0]} -> {actual[0]}, '
+                    f'rating_count {stored[1]} -> {actual[1]}, '
+                    f'rating_sum {stored[2]} -> {actual[2]}')
+                product.units_sold, product.rating_count, product.rating_sum = actual
+                product.modified_date = now
+                drifted.append(product)
+
+        if drifted and not options['dry_run']:
+            with transaction.atomic():
+                Product.all_objects.bulk_update(
+                    drifted, ['units_sold', 'rating_count', 'rating_sum', 'modified_date'],
+                    batch_size=options['batch_size'])
+                TableVersion.bump('product')
+
+        verb = 'found' if options['dry_run'] else 'fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'Checked {checked} products, {verb} {len(drifted)} with drifted counters'))
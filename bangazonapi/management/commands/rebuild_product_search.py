@@ -0,0 +1,39 @@
+"""Management command to rebuild the full-text product search index"""
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from bangazonapi import search
+from bangazonapi.models import Product
+
+
+class Command(BaseCommand):
+    help = 'Recreate the FTS5 product search index from the products table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Number of products indexed per batch')
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            raise CommandError('Full-text product search needs the sqlite3 database backend')
+
+        batch_size = options['batch_size']
+        rows = Product.objects.order_by('id').values_list('id', 'name', 'description')
+
+        indexed = 0
+        with transaction.atomic():
+            search.create_index()
+            search.clear_index()
+
+            batch = []
+            for row in rows.iterator(chunk_size=batch_size):
+                batch.append(row)
+                if len(batch) == batch_size:
+                    search.index_products(batch)
+                    indexed += len(batch)
+                    batch = []
+
+            search.index_products(batch)
+            indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} products'))
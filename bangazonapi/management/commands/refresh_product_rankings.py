@@ -0,0 +1,33 @@
+"""Management command to refresh the materialized product rankings"""
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from bangazonapi.models import ProductRanking, ProductTrendScore
+
+
+class Command(BaseCommand):
+    help = ('Decay the trending scores, add newly paid orders, take back unpaid ones, and rebuild the '
+            'top seller and trending lists. Meant to run every few minutes from cron.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--limit', type=int, default=50,
+            help='Number of products kept per list')
+        parser.add_argument(
+            '--half-life-hours', type=float, default=72,
+            help='Hours for a sale to lose half its weight in the trending score')
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recompute the trending scores from scratch')
+
+    def handle(self, *args, **options):
+        if options['limit'] < 1 or options['half_life_hours'] <= 0:
+            raise CommandError('--limit and --half-life-hours must be positive')
+
+        now = timezone.now()
+        scored = ProductTrendScore.refresh(
+            datetime.timedelta(hours=options['half_life_hours']), now=now, full=options['full'])
+        written = ProductRanking.refresh(options['limit'], now=now)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{scored} products are trending, wrote {written} ranking rows'))
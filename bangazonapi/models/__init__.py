@@ -1,5 +1,5 @@
 from .customer import Customer
-from .order import Order
+from .order import EmptyOrder, Order, OrderClosed, OutOfStock, PaymentRejected, ProductUnavailable
 from .orderproduct import OrderProduct
 from .payment import Payment
 from .product import Product
@@ -8,3 +8,6 @@ from .recommendation import Recommendation
 from .rating import Rating
 from .favorite import Favorite
 from .productrating import ProductRating
+from .tableversion import TableVersion
+from .producttrendscore import ProductTrendScore
+from .productranking import ProductRanking
@@ -1,10 +1,175 @@
 """Customer order model"""
-from django.db import models
+from decimal import Decimal
+from django.db import models, transaction
+from django.db.models import DecimalField, F, IntegerField, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce, Now, Round
+from django.utils import timezone
 from .customer import Customer
+from .orderproduct import OrderProduct
 from .payment import Payment
+from .product import Product
+from .tableversion import TableVersion
+
+
+class OutOfStock(Exception):
+    """Checkout failed because products on the order do not have enough stock
+
+    Attributes:
+        products -- Product ids that could not be reserved
+    """
+
+    def __init__(self, products):
+        super().__init__(f'Not enough stock for products {", ".join(map(str, products))}')
+        self.products = products
+
+
+class ProductUnavailable(Exception):
+    """Checkout failed because products on the order have been deleted
+
+    Attributes:
+        products -- Ids of the deleted products
+    """
+
+    def __init__(self, products):
+        super().__init__(f'Products {", ".join(map(str, products))} are no longer for sale')
+        self.products = products
+
+
+class PaymentRejected(Exception):
+    """The payment type cannot pay for the order"""
+
+
+class OrderClosed(Exception):
+    """The order was already paid for"""
+
+
+class EmptyOrder(Exception):
+    """The order has no line items to pay for"""
+
+
+class OrderQuerySet(models.QuerySet):
+
+    def with_computed_totals(self):
+        """Annotate each order with its subtotal and item count aggregated
+        from its line items
+
+        Returns:
+            OrderQuerySet -- Orders with `computed_subtotal` and
+                `computed_item_count` annotations
+        """
+        line_items = OrderProduct.objects.filter(order=OuterRef('pk')).order_by().values('order')
+        return self.annotate(
+            computed_subtotal=Coalesce(Subquery(
+                line_items.annotate(total=Round(Sum(F('quantity') * F('unit_price')), 2)).values('total'),
+                output_field=DecimalField(max_digits=12, decimal_places=2)), Decimal('0.00')),
+            computed_item_count=Coalesce(Subquery(
+                line_items.annotate(total=Sum('quantity')).values('total'),
+                output_field=IntegerField()), 0))
+
+    def refresh_totals(self):
+        """Recompute `subtotal` and `item_count` of the orders from their
+        line items in one UPDATE
+
+        Returns:
+            int -- Number of orders updated
+        """
+        totals = self.model.objects.filter(pk=OuterRef('pk')).with_computed_totals()
+        return self.update(
+            subtotal=Subquery(totals.values('computed_subtotal')),
+            item_count=Subquery(totals.values('computed_item_count')),
+            modified_date=timezone.now())
 
 
 class Order(models.Model):
+    """A customer's order. The open (unpaid) order is the shopping cart
+
+    `subtotal` and `item_count` follow the line items, and the line items'
+    `unit_price` follows the product prices, while the order is open. All
+    are frozen once it is paid.
+    """
     customer = models.ForeignKey(Customer, on_delete=models.DO_NOTHING,)
     payment_type = models.ForeignKey(Payment, on_delete=models.DO_NOTHING, null=True)
     created_date = models.DateField(default="0000-00-00",)
+    modified_date = models.DateTimeField(auto_now=True, db_default=Now())
+    paid_date = models.DateTimeField(null=True, blank=True)
+    # `paid_date` the order's sales were added to the trending scores at,
+    # null while they are not counted
+    trend_paid_date = models.DateTimeField(null=True, blank=True)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+    item_count = models.PositiveIntegerField(default=0)
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # The open order (cart) of a customer
+            models.Index(fields=['customer'], condition=Q(payment_type__isnull=True),
+                         name='order_open_by_customer_idx'),
+            # A customer's orders, in keyset pagination order
+            models.Index(fields=['customer', 'created_date', 'id'],
+                         name='order_customer_created_idx'),
+            # Paid orders not yet counted in the trending scores
+            models.Index(fields=['paid_date'], condition=Q(paid_date__isnull=False, trend_paid_date__isnull=True),
+                         name='order_paid_uncounted_idx'),
+            # Orders counted in the trending scores, to find the ones unpaid since
+            models.Index(fields=['trend_paid_date'], condition=Q(trend_paid_date__isnull=False),
+                         name='order_trend_counted_idx'),
+        ]
+
+    def checkout(self, payment):
+        """Reserve stock for every line item and pay for the order, all or nothing
+
+        Stock is taken with a conditional `UPDATE ... WHERE quantity >= n`
+        per line item, in product id order, so concurrent checkouts of the
+        same product never sell more than is in stock. Line items then
+        snapshot the current product prices and the order's totals are
+        recomputed from them.
+
+        Raises:
+            PaymentRejected -- The payment type belongs to someone else or has expired
+            OrderClosed -- The order was paid for, possibly by a concurrent checkout
+            EmptyOrder -- The order has no line items
+            ProductUnavailable -- Products on the order were deleted, nothing is reserved
+            OutOfStock -- Nothing is reserved and the order stays open
+        """
+        expiration_date = Payment.objects.filter(pk=payment.pk, customer_id=self.customer_id) \
+            .values_list('expiration_date', flat=True).first()
+        if expiration_date is None:
+            raise PaymentRejected('payment_type must be one of your payment types')
+        if expiration_date < timezone.localdate():
+            raise PaymentRejected('The payment type has expired')
+
+        with transaction.atomic():
+            now = timezone.now()
+            # Claim the order with a write first, so a second checkout of it waits here
+            claimed = Order.objects.filter(pk=self.pk, payment_type__isnull=True).update(modified_date=now)
+            if not claimed:
+                raise OrderClosed(f'Order {self.pk} is already paid for')
+
+            line_items = list(self.lineitems.order_by('product_id').values_list('product_id', 'quantity'))
+            if not line_items:
+                raise EmptyOrder(f'Order {self.pk} has no products to pay for')
+
+            short = []
+            for product_id, quantity in line_items:
+                reserved = Product.all_objects.filter(
+                    pk=product_id, deleted__isnull=True, quantity__gte=quantity
+                ).update(quantity=F('quantity') - quantity, modified_date=now)
+                if not reserved:
+                    short.append(product_id)
+            if short:
+                deleted = list(Product.all_objects.filter(pk__in=short, deleted__isnull=False)
+                               .order_by('id').values_list('id', flat=True))
+                if deleted:
+                    raise ProductUnavailable(deleted)
+                raise OutOfStock(short)
+
+            self.lineitems.update(
+                unit_price=Subquery(Product.all_objects.filter(pk=OuterRef('product_id')).values('price')),
+                modified_date=now)
+            totals = Order.objects.filter(pk=self.pk).with_computed_totals() \
+                .values_list('computed_subtotal', 'computed_item_count').get()
+            self.subtotal, self.item_count = totals
+
+            self.payment_type = payment
+            self.save()
+            TableVersion.bump('product')
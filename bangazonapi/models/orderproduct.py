@@ -1,4 +1,55 @@
-from django.db import models
+from decimal import Decimal
+from django.core.validators import MinValueValidator
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Now
+
+
+def price_of(product):
+    """The product's price as a line item `unit_price`, in whole cents"""
+    return Decimal(str(product.price)).quantize(Decimal('0.01'))
+
+
+class OrderProductManager(models.Manager):
+    """Manager that keeps one line item per product and order"""
+
+    def add_to_order(self, order, product, quantity=1):
+        """Add `quantity` units of a product to an order, creating its line
+        item or raising the quantity of the existing one. The line item's
+        unit price is set to the product's current price
+
+        Returns:
+            OrderProduct -- The saved line item
+        """
+        with transaction.atomic():
+            line_item = self.select_for_update().filter(order=order, product=product).first()
+            if line_item is None:
+                try:
+                    with transaction.atomic():
+                        return self.create(
+                            order=order, product=product, quantity=quantity, unit_price=price_of(product))
+                except IntegrityError:
+                    # Created by a concurrent request since the lookup
+                    line_item = self.select_for_update().get(order=order, product=product)
+
+            line_item.quantity += quantity
+            line_item.unit_price = price_of(product)
+            line_item.save()
+            return line_item
+
+    def remove_from_order(self, order, product, quantity=1):
+        """Take `quantity` units of a product off an order, deleting the line
+        item once none are left
+
+        Raises:
+            OrderProduct.DoesNotExist -- The product is not on the order
+        """
+        with transaction.atomic():
+            line_item = self.select_for_update().get(order=order, product=product)
+            if line_item.quantity <= quantity:
+                line_item.delete()
+            else:
+                line_item.quantity -= quantity
+                line_item.save()
 
 
 class OrderProduct(models.Model):
@@ -10,3 +61,15 @@ class OrderProduct(models.Model):
     product = models.ForeignKey("Product",
                                 on_delete=models.DO_NOTHING,
                                 related_name="lineitems")
+    quantity = models.PositiveIntegerField(default=1, validators=[MinValueValidator(1)])
+    # Price of one unit, following the product's price while the order is
+    # open and snapshot at checkout
+    unit_price = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    modified_date = models.DateTimeField(auto_now=True, db_default=Now())
+    objects = OrderProductManager()
+
+    class Meta:
+        constraints = [
+            # Also the index for finding a product's line item within an order
+            models.UniqueConstraint(fields=['order', 'product'], name='orderproduct_one_per_product'),
+        ]
@@ -1,4 +1,5 @@
 from django.db import models
+from django.db.models import Q
 from .customer import Customer
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE
@@ -11,3 +12,10 @@ class Payment(SafeDeleteModel):
     customer = models.ForeignKey(Customer, on_delete=models.DO_NOTHING, related_name="payment_types")
     expiration_date = models.DateField(default="0000-00-00",)
     create_date = models.DateField(default="0000-00-00",)
+
+    class Meta:
+        indexes = [
+            # Live payment types of a customer, in keyset pagination order
+            models.Index(fields=['customer', 'create_date', 'id'], condition=Q(deleted__isnull=True),
+                         name='payment_live_by_customer_idx'),
+        ]
@@ -1,16 +1,153 @@
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Case, Count, F, FloatField, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Coalesce, Now
+from safedelete.managers import SafeDeleteAllManager, SafeDeleteManager
 from safedelete.models import SafeDeleteModel
 from safedelete.models import SOFT_DELETE
+from safedelete.queryset import SafeDeleteQueryset
 from .customer import Customer
 from .productcategory import ProductCategory
 from .orderproduct import OrderProduct
 from .productrating import ProductRating
+from .tableversion import TableVersion
+from .. import search
+
+
+class ProductQuerySet(SafeDeleteQueryset):
+    """Queryset for products that exposes the sales and rating counters
+    as `number_sold` and `average_rating` so they can be sorted on"""
+
+    def with_number_sold(self):
+        """Annotate each product with the number of items on completed orders
+
+        Returns:
+            ProductQuerySet -- Products with a `number_sold` annotation
+        """
+        return self.annotate(number_sold=F('units_sold'))
+
+    def with_average_rating(self):
+        """Annotate each product with its average customer rating
+
+        Returns:
+            ProductQuerySet -- Products with an `average_rating` annotation
+        """
+        return self.annotate(average_rating=Case(
+            When(rating_count=0, then=Value(0.0)),
+            default=Cast(F('rating_sum'), FloatField()) / F('rating_count'),
+            output_field=FloatField()))
+
+    def with_stats(self, names=None):
+        """Annotate each product with both `number_sold` and `average_rating`
+
+        Arguments:
+            names {iterable} -- Only add the annotations named here, e.g. the
+                fields a response selects and the field it is ordered by
+        """
+        names = {'number_sold', 'average_rating'} if names is None else set(names)
+        products = self
+        if 'number_sold' in names:
+            products = products.with_number_sold()
+        if 'average_rating' in names:
+            products = products.with_average_rating()
+        return products
+
+    def search(self, text, ranked=True):
+        """Filter to products whose name or description match `text`
+
+        Arguments:
+            ranked {bool} -- Add the `search_rank` annotation. Leave it out
+                when the matches are only counted or grouped
+
+        Returns:
+            ProductQuerySet -- Matching products with a `search_rank`
+                annotation, lower is more relevant
+        """
+        expression = search.match_expression(text)
+        if expression is None:
+            # Still annotated, so callers can order by the rank
+            matches = self.none()
+            return matches.annotate(search_rank=Value(0.0)) if ranked else matches
+
+        if not search.is_supported(self.db):
+            words = Q()
+            for word in text.split():
+                words &= Q(name__icontains=word) | Q(description__icontains=word)
+            matches = self.filter(words)
+            return matches.annotate(search_rank=Value(0.0)) if ranked else matches
+
+        table = search.PRODUCT_SEARCH_TABLE
+        product_id = f'"{self.model._meta.db_table}"."id"'
+        matches = self.filter(
+            id__in=RawSQL(f'SELECT rowid FROM {table} WHERE {table} MATCH %s', (expression,)))
+        if not ranked:
+            return matches
+        return matches.annotate(search_rank=RawSQL(
+            f'SELECT {search.RANK_EXPRESSION} FROM {table} '
+            f'WHERE {table} MATCH %s AND {table}.rowid = {product_id}',
+            (expression,), output_field=FloatField()))
+
+    def bulk_create(self, objs, *args, **kwargs):
+        """Insert products in bulk and do the bookkeeping that `post_save`
+        handlers do for single saves: search index and table versions, the
+        category one included since product counts change"""
+        objs = super().bulk_create(objs, *args, **kwargs)
+
+        search.index_products(
+            [(product.pk, product.name, product.description) for product in objs
+             if product.pk is not None], self.db)
+        TableVersion.bump('product', 'productcategory')
+        return objs
+
+    def with_computed_counters(self):
+        """Annotate each product with its sales and rating counters
+        aggregated from the line item and rating tables
+
+        Returns:
+            ProductQuerySet -- Products with `computed_units_sold`,
+                `computed_rating_count` and `computed_rating_sum` annotations
+        """
+        sold = OrderProduct.objects.filter(
+            product=OuterRef('pk'), order__payment_type__isnull=False
+        ).order_by().values('product').annotate(total=Sum('quantity')).values('total')
+
+        ratings = ProductRating.objects.filter(
+            product=OuterRef('pk')).order_by().values('product')
+
+        return self.annotate(
+            computed_units_sold=Coalesce(
+                Subquery(sold, output_field=IntegerField()), 0),
+            computed_rating_count=Coalesce(
+                Subquery(ratings.annotate(total=Count('id')).values('total'),
+                         output_field=IntegerField()), 0),
+            computed_rating_sum=Coalesce(
+                Subquery(ratings.annotate(total=Sum('rating')).values('total'),
+                         output_field=IntegerField()), 0))
+
+
+class ProductManager(SafeDeleteManager.from_queryset(ProductQuerySet)):
+    pass
+
+
+class ProductAllManager(SafeDeleteAllManager.from_queryset(ProductQuerySet)):
+    pass
 
 
 class Product(SafeDeleteModel):
 
+    IMAGE_READY = 'ready'
+    IMAGE_PENDING = 'pending'
+    IMAGE_FAILED = 'failed'
+    IMAGE_STATUSES = (
+        (IMAGE_READY, 'Ready'),
+        (IMAGE_PENDING, 'Processing'),
+        (IMAGE_FAILED, 'Failed'),
+    )
+
     _safedelete_policy = SOFT_DELETE
+    objects = ProductManager()
+    all_objects = ProductAllManager()
     name = models.CharField(max_length=50,)
     customer = models.ForeignKey(
         Customer, on_delete=models.DO_NOTHING, related_name='products')
@@ -19,12 +156,21 @@ class Product(SafeDeleteModel):
     description = models.CharField(max_length=255,)
     quantity = models.IntegerField(validators=[MinValueValidator(0)],)
     created_date = models.DateField(auto_now_add=True)
+    modified_date = models.DateTimeField(auto_now=True, db_default=Now())
     category = models.ForeignKey(
         ProductCategory, on_delete=models.DO_NOTHING, related_name='products')
     location = models.CharField(max_length=50,)
     image_path = models.ImageField(
         upload_to='products', height_field=None,
         width_field=None, max_length=None, null=True)
+    image_status = models.CharField(
+        max_length=10, choices=IMAGE_STATUSES, default=IMAGE_READY)
+    image_error = models.CharField(max_length=255, blank=True, default='')
+    # Pixel sizes of the WebP variants in storage, see bangazonapi.images
+    image_variant_sizes = models.JSONField(default=list, blank=True)
+    units_sold = models.IntegerField(default=0, db_index=True)
+    rating_count = models.IntegerField(default=0)
+    rating_sum = models.IntegerField(default=0)
 
     @property
     def number_sold(self):
@@ -33,9 +179,14 @@ class Product(SafeDeleteModel):
         Returns:
             int -- Number items on completed orders
         """
-        sold = OrderProduct.objects.filter(
-            product=self, order__payment_type__isnull=False)
-        return sold.count()
+        try:
+            return self.__number_sold
+        except AttributeError:
+            return self.units_sold
+
+    @number_sold.setter
+    def number_sold(self, value):
+        self.__number_sold = value
 
     @property
     def can_be_rated(self):
@@ -55,16 +206,34 @@ class Product(SafeDeleteModel):
         """Average rating calculated attribute for each product
 
         Returns:
-            number -- The average rating for the product
+            number -- The average rating for the product, 0 if it has no ratings
         """
-        ratings = ProductRating.objects.filter(product=self)
-        total_rating = 0
-        for rating in ratings:
-            total_rating += rating.rating
+        try:
+            return self.__average_rating
+        except AttributeError:
+            if self.rating_count == 0:
+                return 0
+            return self.rating_sum / self.rating_count
 
-        avg = total_rating / len(ratings)
-        return avg
+    @average_rating.setter
+    def average_rating(self, value):
+        self.__average_rating = value
 
     class Meta:
         verbose_name = ("product")
         verbose_name_plural = ("products")
+        indexes = [
+            # Live products, newest or oldest first (the default listing order)
+            models.Index(fields=['created_date', 'id'], condition=Q(deleted__isnull=True),
+                         name='product_live_created_idx'),
+            # Live products of a category, by creation date
+            models.Index(fields=['category', 'created_date', 'id'], condition=Q(deleted__isnull=True),
+                         name='product_live_category_idx'),
+            # Listing filters, see ProductFilterSerializer
+            models.Index(fields=['price', 'id'], condition=Q(deleted__isnull=True),
+                         name='product_live_price_idx'),
+            models.Index(fields=['location', 'created_date', 'id'], condition=Q(deleted__isnull=True),
+                         name='product_live_location_idx'),
+            models.Index(fields=['customer', 'created_date', 'id'], condition=Q(deleted__isnull=True),
+                         name='product_live_seller_idx'),
+        ]
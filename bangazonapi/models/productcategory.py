@@ -1,10 +1,63 @@
+from django.conf import settings
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Count, Q
+from .tableversion import TableVersion
+
+
+class ProductCategoryManager(models.Manager):
+    """Manager that serves product categories from the cache
+
+    Categories change a few times a year, so the list (with product counts)
+    and single categories are cached. Cache keys carry the `productcategory`
+    TableVersion, which is bumped by category writes and by product writes
+    that change a category's product count (see `bangazonapi.signals`), so
+    every process sees a write on its next read even with a per-process cache.
+    """
+    list_cache_key = 'productcategories:list:{version}'
+    detail_cache_key = 'productcategories:{pk}:{version}'
+
+    def with_product_count(self):
+        """Annotate each category with its number of live products, in one GROUP BY"""
+        return self.annotate(product_count=Count(
+            'products', filter=Q(products__deleted__isnull=True)))
+
+    def cache_version(self):
+        """The `productcategory` table version the cache keys are built from"""
+        return TableVersion.current('productcategory')[0]
+
+    def cached_list(self):
+        """All categories with a `product_count` attribute
+
+        Returns:
+            list -- ProductCategory instances, ordered by id
+        """
+        key = self.list_cache_key.format(version=self.cache_version())
+        categories = cache.get(key)
+        if categories is None:
+            categories = list(self.with_product_count().order_by('id'))
+            cache.set(key, categories, settings.PRODUCT_CATEGORY_CACHE_TIMEOUT)
+        return categories
+
+    def cached_get(self, pk):
+        """A single category
+
+        Raises:
+            ProductCategory.DoesNotExist -- No category has this primary key
+        """
+        key = self.detail_cache_key.format(pk=pk, version=self.cache_version())
+        category = cache.get(key)
+        if category is None:
+            category = self.get(pk=pk)
+            cache.set(key, category, settings.PRODUCT_CATEGORY_CACHE_TIMEOUT)
+        return category
 
 
 class ProductCategory(models.Model):
 
     name = models.CharField(max_length=55)
+    objects = ProductCategoryManager()
 
     class Meta:
         verbose_name = ("productcategory")
-        verbose_name_plural = ("productcategories")
\ No newline at end of file
+        verbose_name_plural = ("productcategories")
@@ -0,0 +1,80 @@
+from django.db import models, transaction
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from .tableversion import TableVersion
+
+
+class ProductRanking(models.Model):
+    """Materialized best seller and trending lists, globally and per category
+
+    Rows are rebuilt by `refresh()`, see `manage.py refresh_product_rankings`,
+    and read back in rank order with one indexed query. `category` is null
+    for the global lists.
+    """
+    TOP = 'top'
+    TRENDING = 'trending'
+    KINDS = (
+        (TOP, 'All-time top sellers'),
+        (TRENDING, 'Trending'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    category = models.ForeignKey(
+        "ProductCategory", on_delete=models.CASCADE, null=True, related_name="rankings")
+    rank = models.PositiveIntegerField()
+    product = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="rankings")
+    score = models.FloatField()
+    computed_date = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'category', 'rank'], name='productranking_list_idx'),
+        ]
+
+    @classmethod
+    def refresh(cls, limit, now=None):
+        """Rebuild every list from `Product.units_sold` and `ProductTrendScore`
+
+        Arguments:
+            limit {int} -- Number of products kept per list
+
+        Returns:
+            int -- Number of ranking rows written
+        """
+        from .product import Product  # pylint: disable=import-outside-toplevel
+
+        now = now or timezone.now()
+        live = Product.objects.order_by()
+        sources = {
+            cls.TOP: live.filter(units_sold__gt=0).annotate(score=F('units_sold')),
+            cls.TRENDING: live.filter(trend_score__isnull=False).annotate(score=F('trend_score__score')),
+        }
+
+        rows = []
+        ordering = (F('score').desc(), F('id').asc())
+        for kind, products in sources.items():
+            # The global list, then one list per category
+            for partition_by in (None, F('category_id')):
+                ranked = products.annotate(position=Window(
+                    RowNumber(), partition_by=partition_by, order_by=ordering))
+                ranked = ranked.filter(position__lte=limit).values_list(
+                    'position', 'id', 'score', 'category_id')
+                rows.extend(
+                    cls(kind=kind, category_id=category_id if partition_by is not None else None,
+                        rank=position, product_id=product_id, score=score, computed_date=now)
+                    for position, product_id, score, category_id in ranked)
+
+        with transaction.atomic():
+            cls.objects.all().delete()
+            cls.objects.bulk_create(rows, batch_size=500)
+            TableVersion.bump('productranking')
+        return len(rows)
+
+    @classmethod
+    def products(cls, kind, category=None):
+        """The ranked products of one list, best first, in one query"""
+        rankings = cls.objects.filter(kind=kind, product__deleted__isnull=True)
+        rankings = rankings.filter(
+            Q(category__isnull=True) if category is None else Q(category_id=category))
+        return rankings.order_by('rank')
@@ -0,0 +1,98 @@
+from collections import defaultdict
+from django.db import models, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+
+
+class ProductTrendScore(models.Model):
+    """Time-decayed sales score of a product, for the trending ranking
+
+    Every unit sold on a paid order adds 1 to the score, and scores halve
+    every `half_life`. All rows are expressed at the same `scored_date`,
+    so a refresh only decays the existing scores with one UPDATE, adds the
+    paid orders it has not counted yet and takes back counted orders that
+    were unpaid since.
+    """
+
+    product = models.OneToOneField(
+        "Product", on_delete=models.CASCADE, primary_key=True, related_name="trend_score")
+    score = models.FloatField(default=0.0)
+    scored_date = models.DateTimeField(default=timezone.now)
+
+    # Scores below this no longer affect any ranking and are dropped
+    min_score = 0.01
+
+    # Orders read and marked per query
+    batch_size = 500
+
+    @classmethod
+    def refresh(cls, half_life, now=None, full=False):
+        """Bring every score forward to `now`
+
+        Orders are marked with the `paid_date` their sales were counted at
+        (`Order.trend_paid_date`) rather than picked by a time window, so an
+        order stamped before one refresh but committed after it is counted
+        by the next, and orders unpaid or paid again since they were counted
+        are taken back out.
+
+        Arguments:
+            half_life {timedelta} -- Time for a sale to lose half its weight
+            full {bool} -- Recompute from scratch instead of incrementally
+
+        Returns:
+            int -- Number of products with a score
+        """
+        # pylint: disable=import-outside-toplevel
+        from .order import Order
+
+        now = now or timezone.now()
+        # Sales older than ten half-lives are worth less than 0.1%
+        horizon = now - half_life * 10
+
+        with transaction.atomic():
+            since = None if full else cls.objects.aggregate(since=Max('scored_date'))['since']
+            if since is None:
+                cls.objects.all().delete()
+                Order.objects.filter(trend_paid_date__isnull=False).update(trend_paid_date=None)
+            else:
+                factor = 0.5 ** ((now - since) / half_life)
+                cls.objects.update(score=F('score') * factor, scored_date=now)
+
+            gained = defaultdict(float)
+            unpaid = Order.objects.filter(trend_paid_date__gt=horizon) \
+                .exclude(paid_date=F('trend_paid_date'))
+            cls._count_sales(unpaid, 'trend_paid_date', -1, gained, now, half_life)
+            uncounted = Order.objects.filter(
+                paid_date__gt=horizon, paid_date__lte=now, trend_paid_date__isnull=True)
+            cls._count_sales(uncounted, 'paid_date', 1, gained, now, half_life)
+
+            existing = set(cls.objects.filter(pk__in=gained).values_list('pk', flat=True))
+            for product_id in existing:
+                cls.objects.filter(pk=product_id).update(score=F('score') + gained[product_id])
+            cls.objects.bulk_create(
+                [cls(product_id=product_id, score=score, scored_date=now)
+                 for product_id, score in gained.items() if product_id not in existing and score > 0],
+                batch_size=cls.batch_size)
+
+            cls.objects.filter(score__lt=cls.min_score).delete()
+            return cls.objects.count()
+
+    @classmethod
+    def _count_sales(cls, orders, date_field, direction, gained, now, half_life):
+        """Add (or with `direction` -1 take back) the decayed sales of
+        `orders` dated by `date_field` into `gained`, then mark the orders
+        as counted at their current `paid_date`"""
+        # pylint: disable=import-outside-toplevel
+        from .order import Order
+        from .orderproduct import OrderProduct
+
+        order_ids = list(orders.values_list('pk', flat=True))
+        for start in range(0, len(order_ids), cls.batch_size):
+            batch = order_ids[start:start + cls.batch_size]
+            sales = OrderProduct.objects.filter(order_id__in=batch) \
+                .values_list('product_id', 'quantity', f'order__{date_field}')
+            for product_id, quantity, date in sales:
+                gained[product_id] += direction * quantity * 0.5 ** ((now - date) / half_life)
+
+            marked = F('paid_date') if direction > 0 else None
+            Order.objects.filter(pk__in=batch).update(trend_paid_date=marked)
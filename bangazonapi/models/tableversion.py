@@ -0,0 +1,48 @@
+from django.db import models
+from django.db.models import F
+from django.utils import timezone
+
+
+class TableVersion(models.Model):
+    """Change counter for a table, bumped on every write to it
+
+    Cheap to read, so list endpoints can build ETag and Last-Modified
+    headers without touching the rows they would serialize.
+    """
+
+    name = models.CharField(max_length=55, unique=True)
+    version = models.BigIntegerField(default=0)
+    modified_date = models.DateTimeField(default=timezone.now)
+
+    @classmethod
+    def bump(cls, *names):
+        """Record a write to each of the named tables"""
+        now = timezone.now()
+        for name in names:
+            updated = cls.objects.filter(name=name).update(
+                version=F('version') + 1, modified_date=now)
+            if not updated:
+                cls.objects.get_or_create(name=name, defaults={'version': 1, 'modified_date': now})
+
+    @classmethod
+    def current(cls, *names):
+        """Current version of the named tables
+
+        Returns:
+            tuple -- (string like "product:12,productcategory:3",
+                datetime of the latest write or None if never written)
+        """
+        rows = cls.objects.filter(name__in=names).values_list('name', 'version', 'modified_date')
+        versions = {}
+        latest = None
+        for name, version, modified_date in rows:
+            versions[name] = version
+            if latest is None or modified_date > latest:
+                latest = modified_date
+
+        tag = ','.join(f'{name}:{versions.get(name, 0)}' for name in sorted(names))
+        return tag, latest
+
+    class Meta:
+        verbose_name = ("tableversion")
+        verbose_name_plural = ("tableversions")
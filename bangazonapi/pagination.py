@@ -0,0 +1,175 @@
+"""Keyset (cursor) pagination for the hand-written ViewSet list methods"""
+import base64
+import binascii
+import datetime
+import json
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ParseError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Paginate a queryset by seeking past the sort key of the last row seen
+
+    Pages are selected with `WHERE (key, id) > (last_key, last_id)` instead of
+    OFFSET, so every page costs the same no matter how deep it is. The last
+    field of `ordering` must be unique (normally `id`) to break ties.
+
+    Arguments:
+        ordering {tuple} -- Field names to sort by, `-` prefix for descending
+        page_size {int} -- Rows per page when the request has no `limit`,
+            must be positive
+    """
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor'
+    invalid_page_size_message = 'limit must be a positive whole number'
+
+    def __init__(self, ordering=('created_date', 'id'), page_size=None):
+        self.ordering = tuple(ordering)
+        if page_size is not None and page_size < 1:
+            raise ValueError(f'page_size must be positive, not {page_size}')
+        self.page_size = api_settings.PAGE_SIZE if page_size is None else page_size
+        self.request = None
+        self.base_url = None
+        self.page = []
+        self.has_next = False
+        self.has_previous = False
+
+    def get_page_size(self, request):
+        """Read the page size from `?limit=`, capped at `max_page_size`
+
+        Raises:
+            ParseError -- `limit` is not a positive whole number
+        """
+        limit = request.query_params.get(self.page_size_query_param, None)
+        if limit is None:
+            return min(self.page_size, self.max_page_size)
+        if not limit.isdigit() or int(limit) < 1:
+            raise ParseError(self.invalid_page_size_message)
+        return min(int(limit), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """Return one page of `queryset` and remember the cursors around it
+
+        Returns:
+            list -- Model instances on the requested page
+        """
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+
+        position, reverse = self.decode_cursor(request)
+
+        order_by = [self._flip(field) for field in self.ordering] if reverse else list(self.ordering)
+        queryset = self._load_ordering_fields(queryset.order_by(*order_by))
+
+        if position is not None:
+            queryset = queryset.filter(self._seek_filter(position, reverse))
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        self.page = rows[:page_size]
+
+        if reverse:
+            self.page.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = position is not None
+
+        return self.page
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self._link(self.page[0], reverse=True)
+
+    def decode_cursor(self, request):
+        """Turn the `?cursor=` token back into sort key values
+
+        Returns:
+            tuple -- (list of key values or None, True if paging backwards)
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if token is None:
+            return None, False
+
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+            position = cursor['p']
+            reverse = bool(cursor.get('r', False))
+        except (ValueError, TypeError, KeyError, binascii.Error, UnicodeEncodeError) as ex:
+            raise NotFound(self.invalid_cursor_message) from ex
+
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+
+        return position, reverse
+
+    def encode_cursor(self, position, reverse):
+        cursor = {'p': position}
+        if reverse:
+            cursor['r'] = 1
+        token = base64.urlsafe_b64encode(json.dumps(cursor, separators=(',', ':')).encode('ascii'))
+        return token.decode('ascii')
+
+    def _link(self, instance, reverse):
+        position = [self._key_value(instance, field) for field in self.ordering]
+        return replace_query_param(
+            self.base_url, self.cursor_query_param, self.encode_cursor(position, reverse))
+
+    def _seek_filter(self, position, reverse):
+        """Build `(a > x) OR (a = x AND b > y) OR ...` for the sort key"""
+        seek = Q()
+        equal_so_far = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            descending = field.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            seek |= equal_so_far & Q(**{f'{name}__{lookup}': value})
+            equal_so_far &= Q(**{name: value})
+        return seek
+
+    def _load_ordering_fields(self, queryset):
+        """Make sure `.only()` did not defer a sort key the cursor must read"""
+        loaded, deferred = queryset.query.deferred_loading
+        if deferred or not loaded:
+            return queryset
+
+        columns = {field.name for field in queryset.model._meta.concrete_fields}
+        missing = [name for name in (field.lstrip('-') for field in self.ordering)
+                   if name in columns and name not in loaded]
+        if missing:
+            queryset = queryset.only(*loaded, *missing)
+        return queryset
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _key_value(instance, field):
+        value = getattr(instance, field.lstrip('-'))
+        if isinstance(value, (datetime.date, datetime.datetime)):
+            return value.isoformat()
+        return value
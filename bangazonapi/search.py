@@ -0,0 +1,85 @@
+"""Full-text product search backed by an SQLite FTS5 virtual table
+
+The index lives in `bangazonapi_product_fts`, one row per live product with
+`rowid` equal to the product id. It is created after `migrate`, kept in sync
+by the product signal handlers, and can be rebuilt with
+`python manage.py rebuild_product_search`.
+"""
+import re
+from django.db import connections
+
+PRODUCT_SEARCH_TABLE = 'bangazonapi_product_fts'
+
+# Matches on the product name count ten times as much as the description
+RANK_EXPRESSION = f'bm25({PRODUCT_SEARCH_TABLE}, 10.0, 1.0)'
+
+_TOKEN = re.compile(r'\w+', re.UNICODE)
+
+
+def is_supported(using='default'):
+    """Full-text search needs the sqlite3 backend"""
+    return connections[using].vendor == 'sqlite'
+
+
+def create_index(using='default'):
+    """Create the FTS5 table if it does not exist yet"""
+    if not is_supported(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {PRODUCT_SEARCH_TABLE} '
+            "USING fts5(name, description, tokenize = 'unicode61 remove_diacritics 2')")
+
+
+def index_products(rows, using='default'):
+    """Add or replace index entries
+
+    Arguments:
+        rows {iterable} -- (id, name, description) tuples
+    """
+    if not is_supported(using):
+        return
+
+    rows = list(rows)
+    if not rows:
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {PRODUCT_SEARCH_TABLE} WHERE rowid = %s', [(row[0],) for row in rows])
+        cursor.executemany(
+            f'INSERT INTO {PRODUCT_SEARCH_TABLE} (rowid, name, description) VALUES (%s, %s, %s)', rows)
+
+
+def unindex_product(product_id, using='default'):
+    """Remove a product from the index"""
+    if not is_supported(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {PRODUCT_SEARCH_TABLE} WHERE rowid = %s', [product_id])
+
+
+def clear_index(using='default'):
+    """Remove every entry from the index"""
+    if not is_supported(using):
+        return
+
+    with connections[using].cursor() as cursor:
+        cursor.execute(f'DELETE FROM {PRODUCT_SEARCH_TABLE}')
+
+
+def match_expression(text):
+    """Turn free text from a query string into a safe FTS5 MATCH expression
+
+    Every word becomes a quoted prefix term, so `red kit` matches
+    "Red Kite" and user input can never be parsed as FTS5 syntax.
+
+    Returns:
+        str -- MATCH expression, or None if the text has no searchable words
+    """
+    terms = _TOKEN.findall(text or '')
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
@@ -0,0 +1,202 @@
+"""Signal handlers that keep denormalized product data current
+
+`Product.units_sold` sums line item quantities on paid orders, and
+`Product.rating_count`/`Product.rating_sum` mirror the product's ratings.
+Open orders keep `Order.subtotal`/`Order.item_count` in step with
+their line items, and their line items' `unit_price` in step with the
+product prices. Fixture loads (`raw=True`) are skipped, so run
+`rebuild_product_counters` and `rebuild_order_totals` after `loaddata`.
+
+The full-text search index follows product saves, soft deletes and
+hard deletes, and every product or category write bumps its
+`TableVersion` so conditional GETs see the change. Product writes that
+change a category's product count (new, deleted, undeleted or moved
+products) also bump `productcategory`, which the category cache keys on.
+"""
+from django.db.models import F, Sum
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+from bangazonapi import search
+from bangazonapi.models import Order, OrderProduct, Product, ProductCategory, ProductRating
+from bangazonapi.models.orderproduct import price_of
+from bangazonapi.models import TableVersion
+
+
+def _adjust_product(product_id, **deltas):
+    """Apply counter deltas to a single product with an UPDATE ... SET x = x + n"""
+    changes = {field: F(field) + delta for field, delta in deltas.items() if delta}
+    if changes:
+        Product.all_objects.filter(pk=product_id).update(
+            modified_date=timezone.now(), **changes)
+        TableVersion.bump('product')
+
+
+@receiver(pre_save, sender=Order)
+def remember_order_payment(sender, instance, raw, **kwargs):
+    """Record whether the order was already paid before this save, and
+    stamp `paid_date` when it is paid"""
+    instance._was_paid = False
+    if raw:
+        return
+    if instance.pk is not None:
+        instance._was_paid = Order.objects.filter(
+            pk=instance.pk, payment_type__isnull=False).exists()
+
+    if instance.payment_type_id is None:
+        instance.paid_date = None
+    elif not instance._was_paid or instance.paid_date is None:
+        instance.paid_date = timezone.now()
+
+
+@receiver(post_save, sender=Order)
+def count_order_sales(sender, instance, raw, **kwargs):
+    """Add or remove an order's line items from `units_sold` when it is paid or unpaid"""
+    if raw:
+        return
+
+    is_paid = instance.payment_type_id is not None
+    if is_paid == getattr(instance, '_was_paid', False):
+        return
+
+    direction = 1 if is_paid else -1
+    sold = OrderProduct.objects.filter(order=instance).order_by() \
+        .values('product').annotate(total=Sum('quantity'))
+    for row in sold:
+        _adjust_product(row['product'], units_sold=direction * row['total'])
+
+
+@receiver(pre_save, sender=OrderProduct)
+def remember_line_item(sender, instance, raw, **kwargs):
+    """Record the product, paid state and quantity the line item had before this save"""
+    instance._previous = None
+    if not raw and instance.pk is not None:
+        instance._previous = OrderProduct.objects.filter(pk=instance.pk) \
+            .values_list('product_id', 'order__payment_type_id', 'quantity').first()
+
+
+@receiver(post_save, sender=OrderProduct)
+def count_line_item_sale(sender, instance, raw, **kwargs):
+    """Count a line item, or a change to its quantity, on an already paid order"""
+    if raw:
+        return
+
+    previous = getattr(instance, '_previous', None)
+    if previous is not None and previous[1] is not None:
+        _adjust_product(previous[0], units_sold=-previous[2])
+
+    if Order.objects.filter(pk=instance.order_id, payment_type__isnull=False).exists():
+        _adjust_product(instance.product_id, units_sold=instance.quantity)
+
+
+@receiver(post_delete, sender=OrderProduct)
+def uncount_line_item_sale(sender, instance, **kwargs):
+    """Remove a deleted line item on a paid order from `units_sold`"""
+    if Order.objects.filter(pk=instance.order_id, payment_type__isnull=False).exists():
+        _adjust_product(instance.product_id, units_sold=-instance.quantity)
+
+
+@receiver(post_save, sender=OrderProduct)
+@receiver(post_delete, sender=OrderProduct)
+def refresh_open_order_totals(sender, instance, raw=False, **kwargs):
+    """Recompute the totals of the line item's order, unless it is paid"""
+    if raw:
+        return
+    Order.objects.filter(pk=instance.order_id, payment_type__isnull=True).refresh_totals()
+
+
+@receiver(pre_save, sender=ProductRating)
+def remember_rating(sender, instance, raw, **kwargs):
+    """Record the product and score the rating had before this save"""
+    instance._previous = None
+    if not raw and instance.pk is not None:
+        instance._previous = ProductRating.objects.filter(pk=instance.pk) \
+            .values_list('product_id', 'rating').first()
+
+
+@receiver(post_save, sender=ProductRating)
+def count_rating(sender, instance, raw, **kwargs):
+    """Fold a new or changed rating into the product's rating counters"""
+    if raw:
+        return
+
+    previous = getattr(instance, '_previous', None)
+    if previous is None:
+        _adjust_product(instance.product_id, rating_count=1, rating_sum=instance.rating)
+    elif previous[0] == instance.product_id:
+        _adjust_product(instance.product_id, rating_sum=instance.rating - previous[1])
+    else:
+        _adjust_product(previous[0], rating_count=-1, rating_sum=-previous[1])
+        _adjust_product(instance.product_id, rating_count=1, rating_sum=instance.rating)
+
+
+@receiver(post_delete, sender=ProductRating)
+def uncount_rating(sender, instance, **kwargs):
+    """Remove a deleted rating from the product's rating counters"""
+    _adjust_product(instance.product_id, rating_count=-1, rating_sum=-instance.rating)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, using, **kwargs):
+    """Create the FTS5 table, which migrations do not know about"""
+    if sender.name == 'bangazonapi':
+        search.create_index(using)
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, using, **kwargs):
+    """Index a saved product, or drop it from the index once soft deleted"""
+    if instance.deleted is not None:
+        search.unindex_product(instance.pk, using)
+    else:
+        search.index_products([(instance.pk, instance.name, instance.description)], using)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, using, **kwargs):
+    """Drop a hard deleted product from the index"""
+    search.unindex_product(instance.pk, using)
+
+
+@receiver(pre_save, sender=Product)
+def remember_product(sender, instance, raw, **kwargs):
+    """Record the category, deleted stamp and price the product had before this save"""
+    instance._previous = None
+    if not raw and instance.pk is not None:
+        instance._previous = Product.all_objects.filter(pk=instance.pk) \
+            .values_list('category_id', 'deleted', 'price').first()
+
+
+@receiver(post_save, sender=Product)
+def bump_product_version(sender, instance, **kwargs):
+    """Bump `product`, and `productcategory` when the product counts of the categories change"""
+    previous = getattr(instance, '_previous', None)
+    if previous is None or previous[:2] != (instance.category_id, instance.deleted):
+        TableVersion.bump('product', 'productcategory')
+    else:
+        TableVersion.bump('product')
+
+
+@receiver(post_save, sender=Product)
+def reprice_open_line_items(sender, instance, raw, **kwargs):
+    """Move the product's line items on open orders to its new price and
+    recompute those orders' totals"""
+    previous = getattr(instance, '_previous', None)
+    if raw or previous is None or previous[2] == instance.price:
+        return
+
+    open_line_items = OrderProduct.objects.filter(product=instance, order__payment_type__isnull=True)
+    if open_line_items.update(unit_price=price_of(instance), modified_date=timezone.now()):
+        Order.objects.filter(
+            payment_type__isnull=True, lineitems__product=instance).refresh_totals()
+
+
+@receiver(post_delete, sender=Product)
+def bump_deleted_product_version(sender, **kwargs):
+    TableVersion.bump('product', 'productcategory')
+
+
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+def bump_category_version(sender, instance, **kwargs):
+    TableVersion.bump('productcategory')
@@ -1,11 +1,50 @@
 """View module for handling requests about customer shopping cart"""
 import datetime
+import hashlib
+from rest_framework.decorators import action
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import status
-from bangazonapi.models import Order, Customer, Product, OrderProduct
+from bangazonapi.models import Order, Customer, Payment, Product, OrderProduct
+from bangazonapi.conditional import conditional
 from .product import ProductSerializer
-from .order import OrderSerializer
+from .order import OrderSerializer, checkout_error, line_items_prefetch
+
+
+def positive_quantity(value):
+    """`value` as a whole number of at least 1, or None if it is not one"""
+    value = str(value)
+    if not value.isdigit() or int(value) < 1:
+        return None
+    return int(value)
+
+
+def cart_summary(request):
+    """Item count, subtotal and modification stamp of the customer's open
+    order, read from the order row alone and kept on the request so the
+    validators and the view share one query
+
+    Returns:
+        dict -- `id`, `item_count`, `subtotal` and `modified_date`, or None
+            when the customer has no open order
+    """
+    if not hasattr(request, '_cart_summary'):
+        request._cart_summary = Order.objects.filter(
+            customer__user=request.auth.user, payment_type__isnull=True
+        ).values('id', 'item_count', 'subtotal', 'modified_date').first()
+    return request._cart_summary
+
+
+def cart_summary_validators(view, request, *args, **kwargs):
+    """ETag and Last-Modified for the cart summary, from the open order's
+    modification stamp, which moves whenever its line items change"""
+    summary = cart_summary(request)
+    if summary is None:
+        return 'cart:none', None
+    digest = hashlib.sha1(
+        f'cart:{summary["id"]}:{summary["modified_date"].isoformat()}:'
+        f'{summary["item_count"]}:{summary["subtotal"]}'.encode('utf-8')).hexdigest()
+    return digest, summary['modified_date']
 
 
 class Cart(ViewSet):
@@ -17,10 +56,27 @@ class Cart(ViewSet):
         @apiName AddLineItem
         @apiGroup ShoppingCart
 
+        @apiDescription Adding a product that is already in the cart raises the
+            quantity of its line item instead of adding another one.
+
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         @apiParam {Number} product_id Id of product to add
+        @apiParam {Number} [quantity=1] Number of units to add
         """
+        quantity = positive_quantity(request.data.get("quantity", 1))
+        if quantity is None:
+            return Response(
+                {'message': 'quantity must be a positive whole number'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            product = Product.objects.get(pk=request.data["product_id"])
+        except (Product.DoesNotExist, KeyError, ValueError):
+            return Response(
+                {'message': 'product_id must be an existing product'},
+                status=status.HTTP_400_BAD_REQUEST)
+
         current_user = Customer.objects.get(user=request.auth.user)
 
         try:
@@ -32,10 +88,7 @@ class Cart(ViewSet):
             open_order.customer = current_user
             open_order.save()
 
-        line_item = OrderProduct()
-        line_item.product = Product.objects.get(pk=request.data["product_id"])
-        line_item.order = open_order
-        line_item.save()
+        OrderProduct.objects.add_to_order(open_order, product, quantity)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -47,18 +100,23 @@ class Cart(ViewSet):
         @apiGroup ShoppingCart
 
         @apiParam {id} id Product Id to remove from cart
+        @apiParam {Number} [quantity=1] Query param with the number of units to remove
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
         """
-        current_user = Customer.objects.get(user=request.auth.user)
-        open_order = Order.objects.get(
-            customer=current_user, payment_type=None)
+        quantity = positive_quantity(request.query_params.get('quantity', 1))
+        if quantity is None:
+            return Response(
+                {'message': 'quantity must be a positive whole number'},
+                status=status.HTTP_400_BAD_REQUEST)
 
-        line_item = OrderProduct.objects.filter(
-            product__id=pk,
-            order=open_order
-        )[0]
-        line_item.delete()
+        current_user = Customer.objects.get(user=request.auth.user)
+        try:
+            open_order = Order.objects.get(
+                customer=current_user, payment_type=None)
+            OrderProduct.objects.remove_from_order(open_order, pk, quantity)
+        except (Order.DoesNotExist, OrderProduct.DoesNotExist) as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -69,15 +127,23 @@ class Cart(ViewSet):
         @apiName GetCart
         @apiGroup ShoppingCart
 
+        @apiParam {String} fields Comma separated product fields to include
+        @apiParam {String} exclude Comma separated product fields to leave out
+
         @apiSuccess (200) {Number} id Order cart
         @apiSuccess (200) {String} url URL of order
         @apiSuccess (200) {String} created_date Date created
         @apiSuccess (200) {Object} payment_type Payment id use to complete order
         @apiSuccess (200) {String} customer URI for customer
-        @apiSuccess (200) {Number} size Number of items in cart
-        @apiSuccess (200) {Object[]} line_items Line items in cart
-        @apiSuccess (200) {Number} line_items.id Line item id
-        @apiSuccess (200) {Object} line_items.product Product in cart
+        @apiSuccess (200) {Number} subtotal Price of the cart at the current product prices
+        @apiSuccess (200) {Number} item_count Number of units in cart
+        @apiSuccess (200) {Number} size Number of units in cart, same as item_count
+        @apiSuccess (200) {Object[]} lineitems Line items in cart, one per product
+        @apiSuccess (200) {Number} lineitems.id Line item id
+        @apiSuccess (200) {Number} lineitems.quantity Units of the product in cart
+        @apiSuccess (200) {Number} lineitems.unit_price Current price of one unit
+        @apiSuccess (200) {Object} lineitems.product Product in cart
+        @apiSuccess (200) {Object[]} products Products in cart
         @apiSuccessExample {json} Success
             {
                 "id": 2,
@@ -109,11 +175,12 @@ class Cart(ViewSet):
         """
         current_user = Customer.objects.get(user=request.auth.user)
         try:
-            open_order = Order.objects.get(
+            open_order = Order.objects.prefetch_related(
+                line_items_prefetch(request)).get(
                 customer=current_user, payment_type=None)
 
-            products_on_order = Product.objects.filter(
-                lineitems__order=open_order)
+            line_items = open_order.lineitems.all()
+            products_on_order = [line_item.product for line_item in line_items]
 
             serialized_order = OrderSerializer(
                 open_order, many=False, context={'request': request})
@@ -125,9 +192,134 @@ class Cart(ViewSet):
                 "order": serialized_order.data
             }
             final["order"]["products"] = product_list.data
-            final["order"]["size"] = len(products_on_order)
+            final["order"]["size"] = open_order.item_count
 
         except Order.DoesNotExist as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
 
         return Response(final["order"])
+
+    @action(methods=['post'], detail=False)
+    def checkout(self, request):
+        """
+        @api {POST} /cart/checkout POST pay for the cart
+        @apiName Checkout
+        @apiGroup ShoppingCart
+
+        @apiDescription Reserves stock for every line item and pays for the
+            open order in one transaction. If any product does not have enough
+            stock, or is no longer for sale, nothing is reserved, the cart stays
+            open and 409 is returned.
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiParam {id} payment_type Payment Id to pay for the order
+        @apiParamExample {json} Input
+            {
+                "payment_type": 6
+            }
+
+        @apiSuccess (201) {id} id Order id
+        @apiSuccess (201) {String} paid_date When the order was paid
+        @apiSuccess (201) {Object} payment_type Payment used
+        @apiSuccess (201) {Object[]} lineitems Products bought
+        @apiSuccess (201) {Number} total Price of the order
+        @apiSuccessExample {json} Success
+            HTTP/1.1 201 Created
+            {
+                "id": 2,
+                "paid_date": "2024-05-01T15:04:12.411Z",
+                "payment_type": {
+                    "id": 6,
+                    "merchant_name": "Visa"
+                },
+                "lineitems": [
+                    {
+                        "product_id": 52,
+                        "name": "900",
+                        "price": 1296.98,
+                        "quantity": 2,
+                        "total": 2593.96
+                    }
+                ],
+                "total": 2593.96
+            }
+
+        @apiError (400) {String} message Unknown or expired payment type, or an empty cart
+        @apiError (409) {String} message Products without enough stock or no longer for sale
+        @apiError (409) {Number[]} products Ids of those products
+        """
+        current_user = Customer.objects.get(user=request.auth.user)
+
+        try:
+            payment = Payment.objects.get(
+                pk=request.data.get("payment_type", None), customer=current_user)
+        except (Payment.DoesNotExist, ValueError, TypeError):
+            return Response(
+                {'message': 'payment_type must be one of your payment types'},
+                status=status.HTTP_400_BAD_REQUEST)
+        try:
+            open_order = Order.objects.get(customer=current_user, payment_type=None)
+        except Order.DoesNotExist as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+
+        error = checkout_error(open_order, payment)
+        if error is not None:
+            return error
+
+        line_items = open_order.lineitems.select_related('product').order_by('product_id')
+        receipt = [
+            {
+                "product_id": line_item.product_id,
+                "name": line_item.product.name,
+                "price": line_item.unit_price,
+                "quantity": line_item.quantity,
+                "total": line_item.unit_price * line_item.quantity,
+            }
+            for line_item in line_items
+        ]
+        return Response({
+            "id": open_order.id,
+            "paid_date": open_order.paid_date,
+            "payment_type": {"id": payment.id, "merchant_name": payment.merchant_name},
+            "lineitems": receipt,
+            "total": open_order.subtotal,
+        }, status=status.HTTP_201_CREATED)
+
+    @action(methods=['get'], detail=False)
+    @conditional(cart_summary_validators)
+    def summary(self, request):
+        """
+        @api {GET} /cart/summary GET item count and subtotal of the cart
+        @apiName GetCartSummary
+        @apiGroup ShoppingCart
+
+        @apiDescription Meant for polling, e.g. by a header badge. Send the
+            ETag back in `If-None-Match` to get 304 while the cart is unchanged.
+            A customer without a cart gets zeros.
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiSuccess (200) {Number} size Number of units in cart
+        @apiSuccess (200) {Number} subtotal Price of the cart at the current product prices
+        @apiSuccess (200) {String} updated_at When the cart last changed, or null
+        @apiSuccessExample {json} Success
+            {
+                "size": 3,
+                "subtotal": 44.97,
+                "updated_at": "2024-05-01T15:04:12.411Z"
+            }
+        """
+        summary = cart_summary(request)
+        if summary is None:
+            return Response({"size": 0, "subtotal": 0, "updated_at": None})
+
+        return Response({
+            "size": summary["item_count"],
+            "subtotal": summary["subtotal"],
+            "updated_at": summary["modified_date"],
+        })
@@ -16,7 +16,7 @@ class LineItemSerializer(serializers.HyperlinkedModelSerializer):
             view_name='lineitem',
             lookup_field='id'
         )
-        fields = ('id', 'url', 'order', 'product')
+        fields = ('id', 'url', 'order', 'product', 'quantity', 'unit_price')
 
 class LineItems(ViewSet):
     """Line items for Bangazon orders"""
@@ -0,0 +1,139 @@
+"""Serve uploaded media files"""
+import mimetypes
+import os
+import re
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import (FileResponse, Http404, HttpResponse, HttpResponseNotAllowed,
+                         StreamingHttpResponse)
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+
+BYTE_RANGE = re.compile(r'^bytes=(?P<start>\d*)-(?P<end>\d*)$')
+RANGE_BLOCK_SIZE = 64 * 1024
+
+
+def serve_media(request, path):
+    '''Serves a file from MEDIA_ROOT with caching headers and Range support
+
+    Files are sent with a long-lived Cache-Control, an ETag built from the
+    file's size and modification time, and Last-Modified, and are answered
+    with 304 when the client's copy is current. A single `Range: bytes=`
+    range is answered with 206 Partial Content.
+
+    When `MEDIA_SENDFILE_HEADER` is "X-Sendfile" or "X-Accel-Redirect", the
+    response body is left to the front proxy. Otherwise the file is handed
+    to a FileResponse, which the WSGI server can send with sendfile().
+
+    Method arguments:
+      request -- The full HTTP request object
+      path -- Path of the file, relative to MEDIA_ROOT
+    '''
+    if request.method not in ('GET', 'HEAD'):
+        return HttpResponseNotAllowed(['GET', 'HEAD'])
+
+    try:
+        full_path = safe_join(os.path.abspath(settings.MEDIA_ROOT), path)
+    except SuspiciousFileOperation as ex:
+        raise Http404('File not found') from ex
+
+    try:
+        stat = os.stat(full_path)
+    except OSError as ex:
+        raise Http404('File not found') from ex
+    if not os.path.isfile(full_path):
+        raise Http404('File not found')
+
+    size = stat.st_size
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{size:x}')
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        byte_range = _requested_range(request, size, etag, last_modified)
+        if byte_range == 'unsatisfiable':
+            response = HttpResponse(status=416)
+            response.headers['Content-Range'] = f'bytes */{size}'
+        else:
+            response = _file_response(request, full_path, path, size, byte_range)
+
+    response.headers['ETag'] = etag
+    response.headers['Last-Modified'] = http_date(last_modified)
+    response.headers['Accept-Ranges'] = 'bytes'
+    patch_cache_control(response, public=True, max_age=settings.MEDIA_CACHE_MAX_AGE)
+    return response
+
+
+def _file_response(request, full_path, path, size, byte_range):
+    content_type, encoding = mimetypes.guess_type(full_path)
+    content_type = content_type or 'application/octet-stream'
+    start, end = byte_range if byte_range else (0, size - 1)
+    length = end - start + 1 if size else 0
+
+    sendfile_header = settings.MEDIA_SENDFILE_HEADER
+    if sendfile_header:
+        # The proxy sends the body, and answers Range requests itself
+        response = HttpResponse(content_type=content_type)
+        if sendfile_header.lower() == 'x-accel-redirect':
+            response.headers['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX + path
+        else:
+            response.headers[sendfile_header] = full_path
+        return response
+
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    elif byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        response = StreamingHttpResponse(
+            _read_range(full_path, start, length), content_type=content_type, status=206)
+
+    if byte_range is not None:
+        response.status_code = 206
+        response.headers['Content-Range'] = f'bytes {start}-{end}/{size}'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.headers['Content-Length'] = str(length)
+    return response
+
+
+def _requested_range(request, size, etag, last_modified):
+    """The (first byte, last byte) the client asked for, None for the whole
+    file, or 'unsatisfiable'"""
+    header = request.META.get('HTTP_RANGE', '')
+    match = BYTE_RANGE.match(header.strip())
+    if match is None:
+        # Missing, malformed or multiple ranges are answered with the whole file
+        return None
+
+    if_range = request.META.get('HTTP_IF_RANGE', None)
+    if if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified:
+        return None
+
+    start, end = match.group('start'), match.group('end')
+    if not start and not end:
+        return None
+    if not start:
+        # Suffix range, the last `end` bytes
+        length = int(end)
+        if length == 0 or size == 0:
+            return 'unsatisfiable'
+        return max(size - length, 0), size - 1
+
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def _read_range(full_path, start, length):
+    with open(full_path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(RANGE_BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
@@ -1,12 +1,17 @@
 """View module for handling requests about customer order"""
 import datetime
+from django.db.models import Prefetch
 from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from rest_framework.decorators import action
-from bangazonapi.models import Order, Payment, Customer, Product, OrderProduct
+from bangazonapi.models import (EmptyOrder, Order, OrderClosed, OutOfStock, Payment, PaymentRejected,
+                                Customer, Product, ProductUnavailable, OrderProduct)
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.streaming import NDJSONRenderer, stream_response, wants_stream
+from rest_framework.renderers import JSONRenderer
 from .product import ProductSerializer
 
 
@@ -21,9 +26,25 @@ class OrderLineItemSerializer(serializers.HyperlinkedModelSerializer):
             view_name='lineitem',
             lookup_field='id'
         )
-        fields = ('id', 'product')
+        fields = ('id', 'quantity', 'unit_price', 'product')
         depth = 1
 
+def line_items_prefetch(request):
+    """Prefetch an order's line items with just the product columns the
+    requested product fields need
+
+    Products are joined in, and their sales and rating figures are the
+    counter columns, so serializing any number of orders costs one query
+    for the orders and one for all of their line items.
+
+    Returns:
+        Prefetch -- For `Order` querysets
+    """
+    line_items = OrderProduct.objects.select_related('product').only(
+        'id', 'order', 'quantity', 'unit_price', *ProductSerializer.query_columns(request, prefix='product__'))
+    return Prefetch('lineitems', queryset=line_items)
+
+
 class OrderSerializer(serializers.HyperlinkedModelSerializer):
     """JSON serializer for customer orders"""
 
@@ -35,11 +56,32 @@ class OrderSerializer(serializers.HyperlinkedModelSerializer):
             view_name='order',
             lookup_field='id'
         )
-        fields = ('id', 'url', 'created_date', 'payment_type', 'customer', 'lineitems')
+        fields = ('id', 'url', 'created_date', 'payment_type', 'customer',
+                  'subtotal', 'item_count', 'lineitems')
+
+
+def checkout_error(order, payment):
+    """Pay for `order` with `payment`, see `Order.checkout()`
+
+    Returns:
+        Response -- The error to send, or None once the order is paid
+    """
+    try:
+        order.checkout(payment)
+    except (PaymentRejected, EmptyOrder) as ex:
+        return Response({'message': str(ex)}, status=status.HTTP_400_BAD_REQUEST)
+    except (OutOfStock, ProductUnavailable) as ex:
+        return Response(
+            {'message': str(ex), 'products': ex.products},
+            status=status.HTTP_409_CONFLICT)
+    except OrderClosed as ex:
+        return Response({'message': str(ex)}, status=status.HTTP_409_CONFLICT)
+    return None
 
 
 class Orders(ViewSet):
     """View for interacting with customer orders"""
+    renderer_classes = (JSONRenderer, NDJSONRenderer)
 
     def retrieve(self, request, pk=None):
         """
@@ -57,6 +99,8 @@ class Orders(ViewSet):
         @apiSuccess (200) {String} created_date Date order was created
         @apiSuccess (200) {String} payment_type Payment URI
         @apiSuccess (200) {String} customer Customer URI
+        @apiSuccess (200) {Number} subtotal Price of the order, frozen once paid
+        @apiSuccess (200) {Number} item_count Number of units on the order
 
         @apiSuccessExample {json} Success
             {
@@ -68,8 +112,8 @@ class Orders(ViewSet):
             }
         """
         try:
-            customer = Customer.objects.get(user=request.auth.user)
-            order = Order.objects.get(pk=pk, customer=customer)
+            order = Order.objects.prefetch_related(
+                line_items_prefetch(request)).get(pk=pk, customer__user=request.auth.user)
             serializer = OrderSerializer(order, context={'request': request})
             return Response(serializer.data)
 
@@ -101,11 +145,22 @@ class Orders(ViewSet):
 
         @apiSuccessExample {json} Success
             HTTP/1.1 204 No Content
+
+        @apiError (400) {String} message The payment type has expired, or the order is empty
+        @apiError (409) {String} message Products without enough stock or no longer for sale,
+            or the order is already paid
         """
         customer = Customer.objects.get(user=request.auth.user)
-        order = Order.objects.get(pk=pk, customer=customer)
-        order.payment_type = request.data["payment_type"]
-        order.save()
+        try:
+            order = Order.objects.get(pk=pk, customer=customer)
+            payment = Payment.objects.get(
+                pk=request.data["payment_type"], customer=customer)
+        except (Order.DoesNotExist, Payment.DoesNotExist) as ex:
+            return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
+
+        error = checkout_error(order, payment)
+        if error is not None:
+            return error
 
         return Response({}, status=status.HTTP_204_NO_CONTENT)
 
@@ -120,33 +175,59 @@ class Orders(ViewSet):
             Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
         @apiParam {id} payment_id Query param to filter by payment used
-
-        @apiSuccess (200) {Object[]} orders Array of order objects
-        @apiSuccess (200) {id} orders.id Order id
-        @apiSuccess (200) {String} orders.url Order URI
-        @apiSuccess (200) {String} orders.created_date Date order was created
-        @apiSuccess (200) {String} orders.payment_type Payment URI
-        @apiSuccess (200) {String} orders.customer Customer URI
+        @apiParam {String} fields Comma separated product fields to include in line items
+        @apiParam {String} exclude Comma separated product fields to leave out of line items
+        @apiParam {Number} limit Number of orders per page, at most 100. Values below 1 are rejected with 400
+        @apiParam {String} cursor Opaque cursor from a `next` or `previous` link
+        @apiParam {Number} stream Send `1` to stream every order as one JSON array instead of a page.
+            Requests with `Accept: application/x-ndjson` get one order per line.
+
+        @apiSuccess (200) {String} next URL of the next page, or null
+        @apiSuccess (200) {String} previous URL of the previous page, or null
+        @apiSuccess (200) {Object[]} results Array of order objects
+        @apiSuccess (200) {id} results.id Order id
+        @apiSuccess (200) {String} results.url Order URI
+        @apiSuccess (200) {String} results.created_date Date order was created
+        @apiSuccess (200) {String} results.payment_type Payment URI
+        @apiSuccess (200) {String} results.customer Customer URI
+        @apiSuccess (200) {Number} results.subtotal Price of the order, frozen once paid
+        @apiSuccess (200) {Number} results.item_count Number of units on the order
 
         @apiSuccessExample {json} Success
-            [
-                {
-                    "id": 1,
-                    "url": "http://localhost:8000/orders/1",
-                    "created_date": "2019-08-16",
-                    "payment_type": "http://localhost:8000/paymenttypes/1",
-                    "customer": "http://localhost:8000/customers/5"
-                }
-            ]
+            {
+                "next": null,
+                "previous": null,
+                "results": [
+                    {
+                        "id": 1,
+                        "url": "http://localhost:8000/orders/1",
+                        "created_date": "2019-08-16",
+                        "payment_type": "http://localhost:8000/paymenttypes/1",
+                        "customer": "http://localhost:8000/customers/5"
+                    }
+                ]
+            }
         """
-        customer = Customer.objects.get(user=request.auth.user)
-        orders = Order.objects.filter(customer=customer)
+        orders = Order.objects.filter(customer__user=request.auth.user).prefetch_related(
+            line_items_prefetch(request))
 
         payment = self.request.query_params.get('payment_id', None)
         if payment is not None:
-            orders = orders.filter(payment__id=payment)
+            if not payment.isdigit():
+                return Response(
+                    {'message': 'payment_id must be a payment type id'},
+                    status=status.HTTP_400_BAD_REQUEST)
+            orders = orders.filter(payment_type_id=payment)
+
+        if wants_stream(request):
+            return stream_response(
+                request, orders.order_by('created_date', 'id'),
+                OrderSerializer(context={'request': request}))
+
+        paginator = KeysetPagination(ordering=('created_date', 'id'))
+        page = paginator.paginate_queryset(orders, request, view=self)
 
         json_orders = OrderSerializer(
-            orders, many=True, context={'request': request})
+            page, many=True, context={'request': request})
 
-        return Response(json_orders.data)
+        return paginator.get_paginated_response(json_orders.data)
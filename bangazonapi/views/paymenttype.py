@@ -5,6 +5,7 @@ from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from bangazonapi.models import Payment, Customer
+from bangazonapi.pagination import KeysetPagination
 
 
 class PaymentSerializer(serializers.HyperlinkedModelSerializer):
@@ -34,8 +35,8 @@ class Payments(ViewSet):
         new_payment = Payment()
         new_payment.merchant_name = request.data["merchant_name"]
         new_payment.account_number = request.data["account_number"]
-        new_payment.expiration_date = request.data["create_date"]
-        new_payment.create_date = request.data["expiration_date"]
+        new_payment.expiration_date = request.data["expiration_date"]
+        new_payment.create_date = request.data["create_date"]
         customer = Customer.objects.get(user=request.auth.user)
         new_payment.customer = customer
         new_payment.save()
@@ -78,7 +79,12 @@ class Payments(ViewSet):
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
     def list(self, request):
-        """Handle GET requests to payment type resource"""
+        """Handle GET requests to payment type resource
+
+        Returns:
+            Response -- One page of JSON serialized payment types, with
+                `next` and `previous` cursor links
+        """
         payment_types = Payment.objects.all()
 
         customer_id = self.request.query_params.get('customer', None)
@@ -86,6 +92,9 @@ class Payments(ViewSet):
         if customer_id is not None:
             payment_types = payment_types.filter(customer__id=customer_id)
 
+        paginator = KeysetPagination(ordering=('create_date', 'id'))
+        page = paginator.paginate_queryset(payment_types, request, view=self)
+
         serializer = PaymentSerializer(
-            payment_types, many=True, context={'request': request})
-        return Response(serializer.data)
+            page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
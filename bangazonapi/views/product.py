@@ -1,31 +1,218 @@
 """View module for handling requests about products"""
 from rest_framework.decorators import action
 from bangazonapi.models.recommendation import Recommendation
-import base64
-from django.core.files.base import ContentFile
+import hashlib
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Count, Q
 from django.http import HttpResponseServerError
 from rest_framework.viewsets import ViewSet
 from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
-from bangazonapi.models import Product, Customer, ProductCategory
+from bangazonapi.models import Product, Customer, ProductCategory, ProductRanking, TableVersion
+from bangazonapi.conditional import conditional, representation, table_validators
+from bangazonapi.images import IMAGE_DATA_URI, submit_product_image, submit_product_variants, variant_urls
+from bangazonapi.pagination import KeysetPagination
+from bangazonapi.streaming import NDJSONParser, NDJSONRenderer, stream_response, wants_stream
+from rest_framework.renderers import JSONRenderer
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from rest_framework.parsers import MultiPartParser, FormParser
+from rest_framework.parsers import JSONParser, MultiPartParser, FormParser
 
 
 class ProductSerializer(serializers.ModelSerializer):
-    """JSON serializer for products"""
+    """JSON serializer for products
+
+    `number_sold` and `average_rating` are read from the queryset annotations
+    when the products were fetched with `Product.objects.with_stats()`, which
+    views limit to the `selected_fields()` so unselected ones cost nothing.
+
+    Clients can ask for a sparse fieldset with `?fields=id,name,price` or
+    `?exclude=description`. Fields that were not requested are dropped
+    before serialization, and `query_columns()` lists the columns the
+    requested fields need so views can pass them to `.only()`.
+
+    `image_variants` maps a size in pixels to the URL of a downscaled WebP
+    copy of the image, see `bangazonapi.images`.
+    """
+    fields_query_param = 'fields'
+    exclude_query_param = 'exclude'
+
+    # Serializer fields that are not a column of the same name
+    field_columns = {
+        'number_sold': ('units_sold',),
+        'average_rating': ('rating_count', 'rating_sum'),
+        'can_be_rated': (),
+        'image_variants': ('image_path', 'image_variant_sizes'),
+    }
+
+    image_variants = serializers.SerializerMethodField()
+
     class Meta:
         model = Product
         fields = ('id', 'name', 'price', 'number_sold', 'description',
                   'quantity', 'created_date', 'location', 'image_path',
-                  'average_rating', 'can_be_rated', )
+                  'image_variants', 'image_status', 'image_error', 'average_rating',
+                  'can_be_rated', )
         depth = 1
 
+    @classmethod
+    def selected_fields(cls, request):
+        """Serializer field names left after applying `?fields=` and `?exclude=`
+
+        Returns:
+            list -- Field names, in serializer order
+        """
+        names = list(cls.Meta.fields)
+        if request is None:
+            return names
+
+        only = request.query_params.get(cls.fields_query_param, None)
+        if only:
+            wanted = {name.strip() for name in only.split(',')}
+            names = [name for name in names if name in wanted]
+
+        exclude = request.query_params.get(cls.exclude_query_param, None)
+        if exclude:
+            unwanted = {name.strip() for name in exclude.split(',')}
+            names = [name for name in names if name not in unwanted]
+
+        return names
+
+    @classmethod
+    def query_columns(cls, request, prefix=''):
+        """Model columns needed to serialize the selected fields
+
+        Arguments:
+            prefix {str} -- Lookup prefix when products are reached through a
+                relation, e.g. `product__`
+
+        Returns:
+            list -- Arguments for `QuerySet.only()`
+        """
+        columns = ['id']
+        for name in cls.selected_fields(request):
+            columns.extend(cls.field_columns.get(name, (name,)))
+        return [f'{prefix}{column}' for column in dict.fromkeys(columns)]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selected = set(self.selected_fields(self.context.get('request', None)))
+        return {name: field for name, field in fields.items() if name in selected}
+
+    def get_image_variants(self, obj):
+        urls = variant_urls(obj.image_path.name if obj.image_path else None, obj.image_variant_sizes)
+        request = self.context.get('request', None)
+        if request is not None:
+            urls = {size: request.build_absolute_uri(url) for size, url in urls.items()}
+        return urls
+
+
+class BulkProductSerializer(serializers.Serializer):
+    """Validates one item of a bulk product upload
+
+    `image_path` is either a base64 data URI or a reference to a file
+    that is already in media storage, e.g. `products/kite.png`.
+    """
+    name = serializers.CharField(max_length=50)
+    price = serializers.FloatField(min_value=0.00, max_value=10000.00)
+    description = serializers.CharField(max_length=255)
+    quantity = serializers.IntegerField(min_value=0)
+    location = serializers.CharField(max_length=50)
+    category_id = serializers.IntegerField()
+    image_path = serializers.CharField(required=False, allow_null=True, allow_blank=True)
+
+    def validate_image_path(self, value):
+        if not value or IMAGE_DATA_URI.match(value):
+            return value or None
+
+        if value.startswith('/') or '..' in value.split('/'):
+            raise serializers.ValidationError('Image references must be relative media paths')
+        if not default_storage.exists(value):
+            raise serializers.ValidationError('Referenced image does not exist')
+        return value
+
+
+class ProductFilterSerializer(serializers.Serializer):
+    """Validates the filter query params of the product listing
+
+    Every filter is backed by an index on live products, see `Product.Meta`.
+    """
+    category = serializers.IntegerField(required=False)
+    min_price = serializers.FloatField(required=False, min_value=0.00)
+    max_price = serializers.FloatField(required=False, min_value=0.00)
+    location = serializers.CharField(required=False, max_length=50)
+    seller = serializers.IntegerField(required=False)
+    created_after = serializers.DateField(required=False)
+    # number_sold is the historical name for max_sold
+    number_sold = serializers.IntegerField(required=False)
+    min_sold = serializers.IntegerField(required=False)
+    max_sold = serializers.IntegerField(required=False)
+
+    lookups = {
+        'category': 'category_id',
+        'min_price': 'price__gte',
+        'max_price': 'price__lte',
+        'location': 'location',
+        'seller': 'customer_id',
+        'created_after': 'created_date__gte',
+        'number_sold': 'units_sold__lte',
+        'min_sold': 'units_sold__gte',
+        'max_sold': 'units_sold__lte',
+    }
+
+    def validate(self, attrs):
+        if attrs.get('min_price', 0) > attrs.get('max_price', float('inf')):
+            raise serializers.ValidationError({'max_price': ['Must not be less than min_price']})
+        return attrs
+
+    def filters(self, exclude=()):
+        """Keyword arguments for `QuerySet.filter()`
+
+        Arguments:
+            exclude {tuple} -- Names of filters to leave out
+        """
+        return {self.lookups[name]: value for name, value in self.validated_data.items()
+                if name not in exclude}
+
+    @classmethod
+    def from_request(cls, request):
+        return cls(data={name: value for name, value in request.query_params.items()
+                         if name in cls.lookups})
+
+    def error_message(self):
+        return ' '.join(f'{name}: {" ".join(str(error) for error in errors)}'
+                        for name, errors in self.errors.items())
+
+
+def product_validators(view, request, pk=None):
+    """ETag and Last-Modified for a single product, from its modification
+    stamp and the category table version"""
+    modified_date = Product.objects.filter(pk=pk).values_list('modified_date', flat=True).first()
+    if modified_date is None:
+        return None
+
+    versions, categories_modified = TableVersion.current('productcategory')
+    digest = hashlib.sha1(
+        f'product:{pk}:{modified_date.isoformat()}|{versions}|{representation(request)}'.encode('utf-8')
+    ).hexdigest()
+
+    if categories_modified is not None and categories_modified > modified_date:
+        return digest, categories_modified
+    return digest, modified_date
+
 
 class Products(ViewSet):
     """Request handlers for Products in the Bangazon Platform"""
     permission_classes = (IsAuthenticatedOrReadOnly,)
+    renderer_classes = (JSONRenderer, NDJSONRenderer)
+    max_bulk_items = 5000
+    # Lower bounds of the price facet buckets, the last one is open ended
+    facet_price_buckets = (0, 10, 25, 50, 100, 250, 500, 1000)
+    facet_location_limit = 10
+    ranking_page_size = 10
+    sortable_fields = ('id', 'name', 'price', 'quantity', 'created_date',
+                       'location', 'number_sold', 'average_rating')
 
     def create(self, request):
         """
@@ -43,6 +230,12 @@ class Products(ViewSet):
         @apiParam {Number} quantity Number of items to sell
         @apiParam {String} location City where product is located
         @apiParam {Number} category_id Category of product
+        @apiParam {String} [image_path] Base64 data URI of the product image
+
+        @apiDescription The product is created right away. An uploaded image is
+            validated and stored in the background, and `image_status` moves from
+            `pending` to `ready`, or to `failed` with the reason in `image_error`.
+
         @apiParamExample {json} Input
             {
                 "name": "Kite",
@@ -62,6 +255,9 @@ class Products(ViewSet):
         @apiSuccess (200) {Date} product.created_date City where product is located
         @apiSuccess (200) {String} product.location City where product is located
         @apiSuccess (200) {String} product.image_path Path to product image
+        @apiSuccess (200) {Object} product.image_variants URLs of WebP copies of the image, keyed by size in pixels
+        @apiSuccess (200) {String} product.image_status One of ready, pending or failed
+        @apiSuccess (200) {String} product.image_error Why the image upload failed
         @apiSuccess (200) {Number} product.average_rating Average customer rating of product
         @apiSuccess (200) {Number} product.number_sold How many items have been purchased
         @apiSuccess (200) {Object} product.category Category of product
@@ -77,6 +273,9 @@ class Products(ViewSet):
                 "created_date": "2019-10-23",
                 "location": "Pittsburgh",
                 "image_path": null,
+                "image_variants": {},
+                "image_status": "pending",
+                "image_error": "",
                 "average_rating": 0,
                 "category": {
                     "url": "http://localhost:8000/productcategories/6",
@@ -97,20 +296,25 @@ class Products(ViewSet):
         product_category = ProductCategory.objects.get(pk=request.data["category_id"])
         new_product.category = product_category
 
-        if "image_path" in request.data:
-            format, imgstr = request.data["image_path"].split(';base64,')
-            ext = format.split('/')[-1]
-            data = ContentFile(base64.b64decode(imgstr), name=f'{new_product.id}-{request.data["name"]}.{ext}')
-
-            new_product.image_path = data
+        image = request.data.get("image_path", None)
+        if image:
+            if not isinstance(image, str) or not IMAGE_DATA_URI.match(image):
+                return Response(
+                    {'message': 'image_path must be a base64 data URI such as data:image/png;base64,...'},
+                    status=status.HTTP_400_BAD_REQUEST)
+            new_product.image_status = Product.IMAGE_PENDING
 
-        new_product.save()
+        with transaction.atomic():
+            new_product.save()
+            if image:
+                submit_product_image(new_product.id, image)
 
         serializer = ProductSerializer(
             new_product, context={'request': request})
 
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @conditional(product_validators)
     def retrieve(self, request, pk=None):
         """
         @api {GET} /products/:id GET product
@@ -128,6 +332,9 @@ class Products(ViewSet):
         @apiSuccess (200) {Date} product.created_date City where product is located
         @apiSuccess (200) {String} product.location City where product is located
         @apiSuccess (200) {String} product.image_path Path to product image
+        @apiSuccess (200) {Object} product.image_variants URLs of WebP copies of the image, keyed by size in pixels
+        @apiSuccess (200) {String} product.image_status One of ready, pending or failed
+        @apiSuccess (200) {String} product.image_error Why the image upload failed
         @apiSuccess (200) {Number} product.average_rating Average customer rating of product
         @apiSuccess (200) {Number} product.number_sold How many items have been purchased
         @apiSuccess (200) {Object} product.category Category of product
@@ -151,7 +358,8 @@ class Products(ViewSet):
             }
         """
         try:
-            product = Product.objects.get(pk=pk)
+            product = Product.objects.with_stats(ProductSerializer.selected_fields(request)).only(
+                *ProductSerializer.query_columns(request)).get(pk=pk)
             serializer = ProductSerializer(product, context={'request': request})
             return Response(serializer.data)
         except Exception as ex:
@@ -214,42 +422,92 @@ class Products(ViewSet):
         except Exception as ex:
             return Response({'message': ex.args[0]}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @conditional(table_validators('product', 'productcategory'))
     def list(self, request):
         """
         @api {GET} /products GET all products
         @apiName ListProducts
         @apiGroup Product
 
-        @apiSuccess (200) {Object[]} products Array of products
+        @apiParam {String} fields Comma separated product fields to include
+        @apiParam {String} exclude Comma separated product fields to leave out
+        @apiParam {String} q Query param to search product names and descriptions, best matches first
+        @apiParam {Number} category Query param to filter by category
+        @apiParam {Number} min_price Query param to filter to products costing at least this much
+        @apiParam {Number} max_price Query param to filter to products costing at most this much
+        @apiParam {String} location Query param to filter to products in this city
+        @apiParam {Number} seller Query param to filter to products sold by this customer id
+        @apiParam {Date} created_after Query param to filter to products listed on or after this date
+        @apiParam {Number} number_sold Query param to filter to products sold at most this many times
+        @apiParam {Number} min_sold Query param to filter to products sold at least this many times
+        @apiParam {Number} max_sold Query param to filter to products sold at most this many times
+        @apiParam {String} order_by Query param to sort by a product field
+        @apiParam {String} direction Sort direction, `asc` or `desc`
+        @apiParam {Number} quantity Query param to get the latest N products
+        @apiParam {Number} limit Number of products per page, at most 100. Values below 1 are rejected with 400
+        @apiParam {String} cursor Opaque cursor from a `next` or `previous` link
+        @apiParam {Number} stream Send `1` to stream every matching product as one JSON array instead of a page.
+            Requests with `Accept: application/x-ndjson` get one product per line.
+
+        @apiSuccess (200) {String} next URL of the next page, or null
+        @apiSuccess (200) {String} previous URL of the previous page, or null
+        @apiSuccess (200) {Object[]} results Array of products
         @apiSuccessExample {json} Success
-            [
-                {
-                    "id": 101,
-                    "url": "http://localhost:8000/products/101",
-                    "name": "Kite",
-                    "price": 14.99,
-                    "number_sold": 0,
-                    "description": "It flies high",
-                    "quantity": 60,
-                    "created_date": "2019-10-23",
-                    "location": "Pittsburgh",
-                    "image_path": null,
-                    "average_rating": 0,
-                    "category": {
-                        "url": "http://localhost:8000/productcategories/6",
-                        "name": "Games/Toys"
+            {
+                "next": "http://localhost:8000/products?cursor=eyJwIjpbIjIwMTktMTAtMjMiLDEwMV19",
+                "previous": null,
+                "results": [
+                    {
+                        "id": 101,
+                        "url": "http://localhost:8000/products/101",
+                        "name": "Kite",
+                        "price": 14.99,
+                        "number_sold": 0,
+                        "description": "It flies high",
+                        "quantity": 60,
+                        "created_date": "2019-10-23",
+                        "location": "Pittsburgh",
+                        "image_path": null,
+                        "average_rating": 0,
+                        "category": {
+                            "url": "http://localhost:8000/productcategories/6",
+                            "name": "Games/Toys"
+                        }
                     }
-                }
-            ]
+                ]
+            }
         """
-        products = Product.objects.all()
-
-        # Support filtering by category and/or quantity
-        category = self.request.query_params.get('category', None)
         quantity = self.request.query_params.get('quantity', None)
         order = self.request.query_params.get('order_by', None)
+        # Sorting on a stat needs its annotation even when it is not returned
+        products = Product.objects.with_stats([*ProductSerializer.selected_fields(request), order]).only(
+            *ProductSerializer.query_columns(request))
         direction = self.request.query_params.get('direction', None)
-        number_sold = self.request.query_params.get('number_sold', None)
+        search_text = self.request.query_params.get('q', None)
+
+        filters = ProductFilterSerializer.from_request(request)
+        if not filters.is_valid():
+            return Response(
+                {'message': filters.error_message()},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        if order is not None and order not in self.sortable_fields:
+            return Response(
+                {'message': f'order_by must be one of {", ".join(self.sortable_fields)}'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        if quantity is not None and (not quantity.isdigit() or int(quantity) < 1):
+            return Response(
+                {'message': 'quantity must be a positive whole number'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        ordering = ('created_date', 'id')
+        page_size = None
+
+        # Search results are ranked by relevance unless a sort was requested
+        if search_text is not None:
+            products = products.search(search_text)
+            ordering = ('search_rank', 'id')
 
         if order is not None:
             order_filter = order
@@ -258,25 +516,293 @@ class Products(ViewSet):
                 if direction == "desc":
                     order_filter = f'-{order}'
 
-            products = products.order_by(order_filter)
+            ordering = (order_filter, '-id' if direction == "desc" else 'id')
 
-        if category is not None:
-            products = products.filter(category__id=category)
+        products = products.filter(**filters.filters())
 
+        # The latest N products are the first page of a newest-first cursor
         if quantity is not None:
-            products = products.order_by("-created_date")[:int(quantity)]
+            ordering = ('-created_date', '-id')
+            page_size = int(quantity)
 
-        if number_sold is not None:
-            def sold_filter(product):
-                if product.number_sold <= int(number_sold):
-                    return True
-                return False
+        if wants_stream(request):
+            products = products.order_by(*ordering)
+            if page_size is not None:
+                products = products[:page_size]
+            return stream_response(
+                request, products, ProductSerializer(context={'request': request}))
 
-            products = filter(sold_filter, products)
+        paginator = KeysetPagination(ordering=ordering, page_size=page_size)
+        page = paginator.paginate_queryset(products, request, view=self)
 
         serializer = ProductSerializer(
-            products, many=True, context={'request': request})
-        return Response(serializer.data)
+            page, many=True, context={'request': request})
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(methods=['get'], detail=False)
+    @conditional(table_validators('product', 'productcategory'))
+    def facets(self, request):
+        """
+        @api {GET} /products/facets GET product filter counts
+        @apiName ProductFacets
+        @apiGroup Product
+
+        @apiDescription Accepts the same `q` and filter params as `GET /products` and
+            counts the matching products per category, price range and location. Each
+            facet ignores its own filter, so the counts show what picking another
+            category, price range or location would return.
+
+        @apiSuccess (200) {Number} count Number of products matching every filter
+        @apiSuccess (200) {Object[]} categories Categories with matching products, most first
+        @apiSuccess (200) {Object[]} prices Price ranges, `max` is exclusive and null for the last range
+        @apiSuccess (200) {Object[]} locations Locations with the most matching products
+        @apiSuccessExample {json} Success
+            {
+                "count": 2,
+                "categories": [
+                    { "id": 6, "name": "Games/Toys", "count": 2 }
+                ],
+                "prices": [
+                    { "min": 0, "max": 10, "count": 0 },
+                    { "min": 10, "max": 25, "count": 2 },
+                    ...
+                    { "min": 1000, "max": null, "count": 0 }
+                ],
+                "locations": [
+                    { "location": "Pittsburgh", "count": 2 }
+                ]
+            }
+        """
+        filters = ProductFilterSerializer.from_request(request)
+        if not filters.is_valid():
+            return Response(
+                {'message': filters.error_message()},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        products = Product.objects.all()
+        search_text = request.query_params.get('q', None)
+        if search_text is not None:
+            products = products.search(search_text, ranked=False)
+
+        def facet(*exclude):
+            return products.filter(**filters.filters(exclude)).order_by()
+
+        categories = (
+            facet('category').values('category_id', 'category__name')
+            .annotate(count=Count('id')).order_by('-count', 'category__name'))
+
+        bounds = list(zip(self.facet_price_buckets, (*self.facet_price_buckets[1:], None)))
+        price_counts = facet('min_price', 'max_price').aggregate(**{
+            f'bucket_{index}': Count('id', filter=Q(price__gte=low) & (
+                Q(price__lt=high) if high is not None else Q()))
+            for index, (low, high) in enumerate(bounds)
+        })
+
+        locations = (
+            facet('location').values('location')
+            .annotate(count=Count('id')).order_by('-count', 'location')[:self.facet_location_limit])
+
+        return Response({
+            'count': facet().count(),
+            'categories': [
+                {'id': row['category_id'], 'name': row['category__name'], 'count': row['count']}
+                for row in categories],
+            'prices': [
+                {'min': low, 'max': high, 'count': price_counts[f'bucket_{index}']}
+                for index, (low, high) in enumerate(bounds)],
+            'locations': list(locations),
+        })
+
+    @action(methods=['get'], detail=False)
+    @conditional(table_validators('productranking', 'product', 'productcategory'))
+    def top(self, request):
+        """
+        @api {GET} /products/top GET best selling products
+        @apiName TopProducts
+        @apiGroup Product
+
+        @apiParam {Number} category Query param to rank within one category
+        @apiParam {Number} limit Number of products, 10 by default
+
+        @apiDescription Served from the rankings materialized by
+            `manage.py refresh_product_rankings`. `score` is the number of units sold.
+
+        @apiSuccess (200) {Date} computed_date When the ranking was refreshed
+        @apiSuccess (200) {Object[]} results Ranked products, best first
+        @apiSuccessExample {json} Success
+            {
+                "computed_date": "2024-05-01T12:00:00Z",
+                "results": [
+                    {
+                        "rank": 1,
+                        "score": 42.0,
+                        "product": {
+                            "id": 101,
+                            "name": "Kite",
+                            ...
+                        }
+                    }
+                ]
+            }
+        """
+        return self.ranking(request, ProductRanking.TOP)
+
+    @action(methods=['get'], detail=False)
+    @conditional(table_validators('productranking', 'product', 'productcategory'))
+    def trending(self, request):
+        """
+        @api {GET} /products/trending GET trending products
+        @apiName TrendingProducts
+        @apiGroup Product
+
+        @apiParam {Number} category Query param to rank within one category
+        @apiParam {Number} limit Number of products, 10 by default
+
+        @apiDescription Like `GET /products/top`, but `score` counts recent sales,
+            each one losing half its weight every few days.
+
+        @apiSuccess (200) {Date} computed_date When the ranking was refreshed
+        @apiSuccess (200) {Object[]} results Ranked products, best first
+        """
+        return self.ranking(request, ProductRanking.TRENDING)
+
+    def ranking(self, request, kind):
+        """One page of a materialized ranking, read with a single query"""
+        category = request.query_params.get('category', None)
+        limit = request.query_params.get('limit', str(self.ranking_page_size))
+        if (category is not None and not category.isdigit()) or not limit.isdigit():
+            return Response(
+                {'message': 'category and limit must be whole numbers'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        category = int(category) if category is not None else None
+        rankings = ProductRanking.products(kind, category) \
+            .select_related('product') \
+            .only('rank', 'score', 'computed_date', 'product',
+                  *ProductSerializer.query_columns(request, prefix='product__'))[:int(limit)]
+        rankings = list(rankings)
+
+        serializer = ProductSerializer(context={'request': request})
+        return Response({
+            'computed_date': rankings[0].computed_date if rankings else None,
+            'results': [
+                {'rank': ranking.rank, 'score': ranking.score,
+                 'product': serializer.to_representation(ranking.product)}
+                for ranking in rankings],
+        })
+
+    @action(methods=['post'], detail=False, parser_classes=(JSONParser, NDJSONParser))
+    def bulk(self, request):
+        """
+        @api {POST} /products/bulk POST many new products
+        @apiName BulkCreateProducts
+        @apiGroup Product
+
+        @apiHeader {String} Authorization Auth token
+        @apiHeaderExample {String} Authorization
+            Token 9ba45f09651c5b0c404f37a2d2572c026c146611
+
+        @apiDescription Send a JSON array of products, or one product per line with
+            `Content-Type: application/x-ndjson`. Every item is validated, and the valid
+            ones are inserted in a single transaction. `image_path` is optional and is
+            either a base64 data URI or the path of an image already in media storage.
+
+        @apiParamExample {json} Input
+            [
+                {
+                    "name": "Kite",
+                    "price": 14.99,
+                    "description": "It flies high",
+                    "quantity": 60,
+                    "location": "Pittsburgh",
+                    "category_id": 4,
+                    "image_path": "products/kite.png"
+                },
+                {
+                    "name": "Kite string",
+                    "price": -1,
+                    "description": "100 yards",
+                    "quantity": 60,
+                    "location": "Pittsburgh",
+                    "category_id": 4
+                }
+            ]
+
+        @apiSuccess (201) {Number} created Number of products created
+        @apiSuccess (201) {Number} failed Number of items rejected
+        @apiSuccess (201) {Object[]} results One result per item, in input order
+        @apiSuccessExample {json} Success
+            {
+                "created": 1,
+                "failed": 1,
+                "results": [
+                    { "index": 0, "id": 101 },
+                    { "index": 1, "errors": { "price": ["Ensure this value is greater than or equal to 0.0."] } }
+                ]
+            }
+        """
+        items = request.data
+        if not isinstance(items, list):
+            return Response(
+                {'message': 'Expected an array of products'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        if len(items) > self.max_bulk_items:
+            return Response(
+                {'message': f'At most {self.max_bulk_items} products can be created per request'},
+                status=status.HTTP_400_BAD_REQUEST)
+
+        customer = Customer.objects.get(user=request.auth.user)
+
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            serializer = BulkProductSerializer(data=item)
+            if serializer.is_valid():
+                valid.append((index, serializer.validated_data))
+            else:
+                results[index] = {'index': index, 'errors': serializer.errors}
+
+        categories = ProductCategory.objects.in_bulk(
+            {data['category_id'] for _, data in valid})
+
+        new_products = []
+        uploads = []
+        for index, data in valid:
+            category = categories.get(data['category_id'], None)
+            if category is None:
+                results[index] = {'index': index, 'errors': {'category_id': ['Category does not exist']}}
+                continue
+
+            new_product = Product(
+                name=data['name'], price=data['price'], description=data['description'],
+                quantity=data['quantity'], location=data['location'],
+                customer=customer, category=category)
+
+            image = data.get('image_path', None)
+            if image and IMAGE_DATA_URI.match(image):
+                new_product.image_status = Product.IMAGE_PENDING
+                uploads.append((new_product, image))
+            else:
+                new_product.image_path = image
+
+            new_products.append((index, new_product))
+
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                [new_product for _, new_product in new_products], batch_size=500)
+            for new_product, image in uploads:
+                submit_product_image(new_product.id, image)
+            submit_product_variants(
+                new_product.image_path.name for _, new_product in new_products if new_product.image_path)
+
+        for index, new_product in new_products:
+            results[index] = {'index': index, 'id': new_product.id}
+
+        created = len(new_products)
+        return Response(
+            {'created': created, 'failed': len(items) - created, 'results': results},
+            status=status.HTTP_201_CREATED if created else status.HTTP_400_BAD_REQUEST)
 
     @action(methods=['post'], detail=True)
     def recommend(self, request, pk=None):
@@ -11,18 +11,21 @@ from rest_framework.response import Response
 from rest_framework import serializers
 from rest_framework import status
 from bangazonapi.models import ProductCategory
+from bangazonapi.conditional import conditional, table_validators
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 
 
 class ProductCategorySerializer(serializers.HyperlinkedModelSerializer):
     """JSON serializer for product category"""
+    product_count = serializers.IntegerField(read_only=True)
+
     class Meta:
         model = ProductCategory
         url = serializers.HyperlinkedIdentityField(
             view_name='productcategory',
             lookup_field='id'
         )
-        fields = ('id', 'url', 'name')
+        fields = ('id', 'url', 'name', 'product_count')
 
 
 class ProductCategories(ViewSet):
@@ -46,15 +49,16 @@ class ProductCategories(ViewSet):
     def retrieve(self, request, pk=None):
         """Handle GET requests for single category"""
         try:
-            category = ProductCategory.objects.get(pk=pk)
+            category = ProductCategory.objects.cached_get(pk)
             serializer = ProductCategorySerializer(category, context={'request': request})
             return Response(serializer.data)
         except Exception as ex:
             return HttpResponseServerError(ex)
 
+    @conditional(table_validators('productcategory'))
     def list(self, request):
         """Handle GET requests to ProductCategory resource"""
-        product_category = ProductCategory.objects.all()
+        product_category = ProductCategory.objects.cached_list()
 
         # Support filtering ProductCategorys by area id
         # name = self.request.query_params.get('name', None)
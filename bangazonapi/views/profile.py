@@ -11,7 +11,8 @@ from bangazonapi.models import Order, Customer, Product
 from bangazonapi.models import OrderProduct, Favorite
 from bangazonapi.models import Recommendation
 from .product import ProductSerializer
-from .order import OrderSerializer
+from .cart import positive_quantity
+from .order import OrderSerializer, line_items_prefetch
 
 
 class Profile(ViewSet):
@@ -132,14 +133,21 @@ class Profile(ViewSet):
             @apiHeaderExample {String} Authorization
                 Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
+            @apiParam {String} fields Comma separated product fields to include
+            @apiParam {String} exclude Comma separated product fields to leave out
+
             @apiSuccess (200) {Number} id Order cart
             @apiSuccess (200) {String} url URL of order
             @apiSuccess (200) {String} created_date Date created
             @apiSuccess (200) {Object} payment_type Payment Id used to complete order
             @apiSuccess (200) {String} customer URI for customer
-            @apiSuccess (200) {Number} size Number of items in cart
-            @apiSuccess (200) {Object[]} line_items Line items in cart
+            @apiSuccess (200) {Number} subtotal Price of the cart at the current product prices
+            @apiSuccess (200) {Number} item_count Number of units in cart
+            @apiSuccess (200) {Number} size Number of units in cart, same as item_count
+            @apiSuccess (200) {Object[]} line_items Line items in cart, one per product
             @apiSuccess (200) {Number} line_items.id Line item id
+            @apiSuccess (200) {Number} line_items.quantity Units of the product in cart
+            @apiSuccess (200) {Number} line_items.unit_price Current price of one unit
             @apiSuccess (200) {Object} line_items.product Product in cart
             @apiSuccessExample {json} Success
                 {
@@ -151,6 +159,7 @@ class Profile(ViewSet):
                     "line_items": [
                         {
                             "id": 4,
+                            "quantity": 1,
                             "product": {
                                 "id": 52,
                                 "url": "http://localhost:8000/products/52",
@@ -175,9 +184,10 @@ class Profile(ViewSet):
             @apiError (404) {String} message  Not found message
             """
             try:
-                open_order = Order.objects.get(
+                open_order = Order.objects.prefetch_related(
+                    line_items_prefetch(request)).get(
                     customer=current_user, payment_type=None)
-                line_items = OrderProduct.objects.filter(order=open_order)
+                line_items = open_order.lineitems.all()
                 line_items = LineItemSerializer(
                     line_items, many=True, context={'request': request})
 
@@ -185,7 +195,7 @@ class Profile(ViewSet):
                 cart["order"] = OrderSerializer(open_order, many=False, context={
                                                 'request': request}).data
                 cart["order"]["line_items"] = line_items.data
-                cart["order"]["size"] = len(line_items.data)
+                cart["order"]["size"] = open_order.item_count
 
             except Order.DoesNotExist as ex:
                 return Response({'message': ex.args[0]}, status=status.HTTP_404_NOT_FOUND)
@@ -202,13 +212,21 @@ class Profile(ViewSet):
             @apiHeaderExample {String} Authorization
                 Token 9ba45f09651c5b0c404f37a2d2572c026c146611
 
+            @apiDescription Adding a product that is already in the cart raises the
+                quantity of its line item instead of adding another one.
+
+            @apiParam {Number} product_id Id of product to add
+            @apiParam {Number} [quantity=1] Number of units to add
+
             @apiSuccess (200) {Object} line_item Line items in cart
             @apiSuccess (200) {Number} line_item.id Line item id
+            @apiSuccess (200) {Number} line_item.quantity Units of the product in cart
             @apiSuccess (200) {Object} line_item.product Product in cart
             @apiSuccess (200) {Object} line_item.order Open order for cart
             @apiSuccessExample {json} Success
                 {
                     "id": 14,
+                    "quantity": 1,
                     "product": {
                         "url": "http://localhost:8000/products/52",
                         "deleted": null,
@@ -230,23 +248,31 @@ class Profile(ViewSet):
                     }
                 }
 
-            @apiError (404) {String} message  Not found message
+            @apiError (400) {String} message Invalid product or quantity
             """
+            quantity = positive_quantity(request.data.get("quantity", 1))
+            if quantity is None:
+                return Response(
+                    {'message': 'quantity must be a positive whole number'},
+                    status=status.HTTP_400_BAD_REQUEST)
+
+            try:
+                product = Product.objects.get(pk=request.data["product_id"])
+            except (Product.DoesNotExist, KeyError, ValueError):
+                return Response(
+                    {'message': 'product_id must be an existing product'},
+                    status=status.HTTP_400_BAD_REQUEST)
 
             try:
-                open_order = Order.objects.get(customer=current_user)
-                print(open_order)
+                open_order = Order.objects.get(
+                    customer=current_user, payment_type=None)
             except Order.DoesNotExist as ex:
                 open_order = Order()
                 open_order.created_date = datetime.datetime.now()
                 open_order.customer = current_user
                 open_order.save()
 
-            line_item = OrderProduct()
-            line_item.product = Product.objects.get(
-                pk=request.data["product_id"])
-            line_item.order = open_order
-            line_item.save()
+            line_item = OrderProduct.objects.add_to_order(open_order, product, quantity)
 
             line_item_json = LineItemSerializer(
                 line_item, many=False, context={'request': request})
@@ -321,7 +347,7 @@ class LineItemSerializer(serializers.HyperlinkedModelSerializer):
 
     class Meta:
         model = OrderProduct
-        fields = ('id', 'product')
+        fields = ('id', 'quantity', 'unit_price', 'product')
         depth = 1
 
 
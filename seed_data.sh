@@ -14,3 +14,7 @@ python manage.py loaddata payment
 python manage.py loaddata order
 python manage.py loaddata order_product
 python manage.py loaddata favoritesellers
+python manage.py rebuild_product_counters
+python manage.py rebuild_order_totals
+python manage.py refresh_product_rankings
+python manage.py analyze_db
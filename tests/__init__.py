@@ -1,3 +1,6 @@
 from .product import ProductTests
 from .order import OrderTests
-from .payments import PaymentTests
\ No newline at end of file
+from .payments import PaymentTests
+from .media import MediaTests
+from .queryplan import QueryPlanTests
+from .order import CheckoutConcurrencyTests
\ No newline at end of file
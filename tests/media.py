@@ -0,0 +1,80 @@
+import os
+import shutil
+import tempfile
+from django.test import override_settings
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+
+class MediaTests(APITestCase):
+    @classmethod
+    def setUpClass(cls):
+        """
+        Serve media from a temporary directory that is removed after the tests
+        """
+        cls.media_root = tempfile.mkdtemp()
+        cls.addClassCleanup(shutil.rmtree, cls.media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=cls.media_root, MEDIA_SENDFILE_HEADER=None)
+        media_settings.enable()
+        cls.addClassCleanup(media_settings.disable)
+        super().setUpClass()
+
+    def setUp(self) -> None:
+        """
+        Write a sample file to media storage
+        """
+        os.makedirs(os.path.join(self.media_root, "products"), exist_ok=True)
+        with open(os.path.join(self.media_root, "products", "kite.txt"), "wb") as file:
+            file.write(b"0123456789")
+
+    def test_serve_media_with_caching_headers(self):
+        """
+        Ensure media is served with validators and answered with 304 when current.
+        """
+        response = self.client.get("/media/products/kite.txt")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        self.assertIn("max-age=", response["Cache-Control"])
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get("/media/products/kite.txt", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        response = self.client.get("/media/products/missing.txt")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        response = self.client.get("/media/../settings.py")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_serve_media_range(self):
+        """
+        Ensure byte ranges are answered with partial content.
+        """
+        response = self.client.get("/media/products/kite.txt", HTTP_RANGE="bytes=2-5")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(response.streaming_content), b"2345")
+        self.assertEqual(response["Content-Range"], "bytes 2-5/10")
+
+        response = self.client.get("/media/products/kite.txt", HTTP_RANGE="bytes=-3")
+        self.assertEqual(b"".join(response.streaming_content), b"789")
+
+        response = self.client.get(
+            "/media/products/kite.txt", HTTP_RANGE="bytes=2-5", HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.get("/media/products/kite.txt", HTTP_RANGE="bytes=20-")
+        self.assertEqual(response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+        self.assertEqual(response["Content-Range"], "bytes */10")
+
+    @override_settings(MEDIA_SENDFILE_HEADER="X-Accel-Redirect")
+    def test_serve_media_through_proxy(self):
+        """
+        Ensure the transfer is handed to the front proxy when configured.
+        """
+        response = self.client.get("/media/products/kite.txt")
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response["X-Accel-Redirect"], "/protected-media/products/kite.txt")
+        self.assertEqual(response.content, b"")
@@ -1,6 +1,19 @@
+import datetime
+import gzip
+import io
 import json
+import tempfile
+import threading
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection, migrations, models
+from django.test import TransactionTestCase
+from django.utils import timezone
 from rest_framework import status
 from rest_framework.test import APITestCase
+from bangazonapi.data_migrations import add_data_migrations, fold_duplicate_line_items
+from bangazonapi.models import Customer, Order, OrderProduct, OutOfStock, Payment, Product, ProductCategory
 
 
 class OrderTests(APITestCase):
@@ -79,6 +92,377 @@ class OrderTests(APITestCase):
         self.assertEqual(json_response["size"], 0)
         self.assertEqual(len(json_response["lineitems"]), 0)
 
-    # TODO: Complete order by adding payment type
+    def test_add_same_product_raises_quantity(self):
+        """
+        Ensure adding a product twice gives one line item with a quantity of two.
+        """
+        self.test_add_product_to_order()
+        self.client.post("/cart", {"product_id": 1}, format='json')
+        self.client.post("/cart", {"product_id": 1, "quantity": 3}, format='json')
+
+        response = self.client.get("/cart", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(len(json_response["lineitems"]), 1)
+        self.assertEqual(json_response["lineitems"][0]["quantity"], 5)
+        self.assertEqual(len(json_response["products"]), 1)
+        self.assertEqual(json_response["size"], 5)
+
+        response = self.client.delete("/cart/1?quantity=2")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        response = self.client.get("/profile/cart", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["line_items"][0]["quantity"], 3)
+        self.assertEqual(json_response["size"], 3)
+
+        response = self.client.post("/cart", {"product_id": 1, "quantity": 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_invalid_add_to_cart_leaves_no_cart(self):
+        """
+        Ensure a rejected add to cart does not open an empty cart, and the profile cart takes a quantity.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post("/cart", {"product_id": 1, "quantity": 0}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post("/cart", {"product_id": 99}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post("/profile/cart", {"product_id": 1, "quantity": "two"}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Order.objects.exists())
+
+        response = self.client.post("/profile/cart", {"product_id": 1, "quantity": 2}, format='json')
+        self.assertEqual(json.loads(response.content)["quantity"], 2)
+
+    def test_line_item_constraint_folds_duplicates_first(self):
+        """
+        Ensure generated migrations fold duplicate line items before enforcing one per product.
+        """
+        migration = migrations.Migration("0002_orderproduct_quantity", "bangazonapi")
+        migration.operations = [migrations.AddConstraint("orderproduct", models.UniqueConstraint(
+            fields=("order", "product"), name="orderproduct_one_per_product"))]
+        add_data_migrations(migration)
+        self.assertIsInstance(migration.operations[0], migrations.RunPython)
+        self.assertIs(migration.operations[0].code, fold_duplicate_line_items)
+        self.assertIsInstance(migration.operations[1], migrations.AddConstraint)
+
+    def test_complete_order_counts_product_sales(self):
+        """
+        Ensure paying for an order adds its line items to number_sold.
+        """
+        self.test_add_product_to_order()
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format='json')
+
+        url = "/paymenttypes"
+        data = {"merchant_name": "Visa", "account_number": "1111-2222",
+                "expiration_date": "2030-01-01", "create_date": "2024-01-01"}
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post(url, data, format='json')
+        payment_id = json.loads(response.content)["id"]
+
+        url = "/orders/1"
+        response = self.client.put(url, {"payment_type": payment_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+
+        response = self.client.get("/products/1", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["number_sold"], 3)
+
+    def _create_payment_type(self):
+        url = "/paymenttypes"
+        data = {"merchant_name": "Visa", "account_number": "1111-2222",
+                "expiration_date": "2030-01-01", "create_date": "2024-01-01"}
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post(url, data, format='json')
+        return json.loads(response.content)["id"]
+
+    def test_checkout_reserves_stock(self):
+        """
+        Ensure checking out pays for the cart, takes the stock and returns a receipt.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post("/cart", {"product_id": 1, "quantity": 3}, format='json')
+        payment_id = self._create_payment_type()
+
+        response = self.client.post("/cart/checkout", {"payment_type": payment_id}, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json_response["payment_type"]["id"], payment_id)
+        self.assertEqual(json_response["lineitems"][0]["quantity"], 3)
+        self.assertAlmostEqual(json_response["total"], 44.97)
+        self.assertIsNotNone(json_response["paid_date"])
+
+        response = self.client.get("/products/1", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["quantity"], 57)
+        self.assertEqual(json_response["number_sold"], 3)
+
+        response = self.client.post("/cart/checkout", {"payment_type": payment_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_checkout_without_enough_stock(self):
+        """
+        Ensure a checkout that would oversell reserves nothing and leaves the cart open.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        data = { "name": "Skateboard", "price": 50, "quantity": 2, "description": "Rolls", "category_id": 1, "location": "Pittsburgh" }
+        self.client.post("/products", data, format='json')
+        self.client.post("/cart", {"product_id": 1, "quantity": 1}, format='json')
+        self.client.post("/cart", {"product_id": 2, "quantity": 3}, format='json')
+        payment_id = self._create_payment_type()
+
+        response = self.client.post("/cart/checkout", {"payment_type": 999}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post("/cart/checkout", {"payment_type": payment_id}, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(json_response["products"], [2])
+
+        response = self.client.get("/products/1", None, format='json')
+        self.assertEqual(json.loads(response.content)["quantity"], 60)
+        response = self.client.get("/cart", None, format='json')
+        self.assertEqual(json.loads(response.content)["size"], 4)
+
+        self.client.delete("/cart/2?quantity=1")
+        response = self.client.post("/cart/checkout", {"payment_type": payment_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.get("/products/2", None, format='json')
+        self.assertEqual(json.loads(response.content)["quantity"], 0)
+
+    def test_checkout_rejects_expired_payment_and_deleted_products(self):
+        """
+        Ensure both checkout routes refuse expired cards, and deleted products are not reported as short.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format='json')
+        url = "/paymenttypes"
+        data = {"merchant_name": "Visa", "account_number": "1111-2222",
+                "expiration_date": "2020-01-01", "create_date": "2019-01-01"}
+        expired_id = json.loads(self.client.post(url, data, format='json').content)["id"]
+
+        response = self.client.put("/orders/1", {"payment_type": expired_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post("/cart/checkout", {"payment_type": expired_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIsNone(Order.objects.get(pk=1).payment_type_id)
+
+        Product.objects.get(pk=1).delete()
+        payment_id = self._create_payment_type()
+        response = self.client.post("/cart/checkout", {"payment_type": payment_id}, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(json_response["products"], [1])
+        self.assertIn("no longer for sale", json_response["message"])
+        self.assertEqual(Product.all_objects.get(pk=1).quantity, 60)
+
+    def test_checkout_rejects_empty_orders(self):
+        """
+        Ensure neither checkout route pays for an order without products.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post("/cart", {"product_id": 1}, format='json')
+        self.client.delete("/cart/1")
+        payment_id = self._create_payment_type()
+
+        response = self.client.put("/orders/1", {"payment_type": payment_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.post("/cart/checkout", {"payment_type": payment_id}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(json.loads(response.content)["message"], "Order 1 has no products to pay for")
+        self.assertIsNone(Order.objects.get(pk=1).payment_type_id)
+
+    def test_order_totals_and_price_snapshots(self):
+        """
+        Ensure order totals and line item prices follow the cart and product prices until checkout.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post("/cart", {"product_id": 1, "quantity": 3}, format='json')
+        self.client.delete("/cart/1")
+
+        response = self.client.get("/cart", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["item_count"], 2)
+        self.assertEqual(json_response["size"], 2)
+        self.assertEqual(json_response["subtotal"], 29.98)
+        self.assertEqual(json_response["lineitems"][0]["unit_price"], 14.99)
+
+        # Saving a new price reprices the open cart
+        product = Product.objects.get(pk=1)
+        product.price = 0.1
+        product.save()
+        response = self.client.get("/cart", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["subtotal"], 0.2)
+        self.assertEqual(json_response["lineitems"][0]["unit_price"], 0.1)
+        self.client.post("/cart", {"product_id": 1}, format='json')
+        self.assertEqual(Order.objects.get(pk=1).subtotal, Decimal("0.30"))
+
+        # Checkout charges the price at the time of checkout
+        Product.objects.filter(pk=1).update(price=20)
+        payment_id = self._create_payment_type()
+        response = self.client.post("/cart/checkout", {"payment_type": payment_id}, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["lineitems"][0]["price"], 20)
+        self.assertEqual(json_response["lineitems"][0]["total"], 60)
+        self.assertEqual(json_response["total"], 60)
+
+        # Later price changes and line item edits leave the paid order alone
+        product.refresh_from_db()
+        product.price = 25
+        product.save()
+        OrderProduct.objects.filter(order_id=1).first().delete()
+        response = self.client.get("/orders/1", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["subtotal"], 60)
+        self.assertEqual(json_response["item_count"], 3)
+
+    def test_cart_summary(self):
+        """
+        Ensure the cart summary reports the cart's size and subtotal and answers 304 while it is unchanged.
+        """
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.get("/cart/summary", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)["size"], 0)
+
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format='json')
+        # Token and the order row
+        with self.assertNumQueries(2):
+            response = self.client.get("/cart/summary", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["size"], 2)
+        self.assertAlmostEqual(json_response["subtotal"], 29.98)
+        self.assertIsNotNone(json_response["updated_at"])
+        etag = response["ETag"]
+
+        response = self.client.get("/cart/summary", None, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.client.post("/cart", {"product_id": 1}, format='json')
+        response = self.client.get("/cart/summary", None, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(response.content)["size"], 3)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_order_history_query_count(self):
+        """
+        Ensure listing and fetching orders takes the same few queries however long the history is.
+        """
+        customer = Customer.objects.get(user__username="steve")
+        payment = Payment.objects.create(
+            merchant_name="Visa", account_number="1111-2222", customer=customer,
+            expiration_date="2030-01-01", create_date="2024-01-01")
+        products = [Product.objects.create(
+            name=f"Kite {number}", price=14.99, quantity=60, description="It flies high",
+            category_id=1, customer=customer, location="Pittsburgh",
+            created_date=datetime.date.today()) for number in range(3)]
+
+        def add_orders(count):
+            for _ in range(count):
+                order = Order.objects.create(
+                    customer=customer, payment_type=payment, created_date=datetime.date.today())
+                OrderProduct.objects.bulk_create(
+                    [OrderProduct(order=order, product=product, quantity=2) for product in products])
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        # Token, orders, line items with their products
+        add_orders(1)
+        with self.assertNumQueries(3):
+            response = self.client.get("/orders", None, format='json')
+        self.assertEqual(len(json.loads(response.content)["results"]), 1)
+
+        add_orders(49)
+        with self.assertNumQueries(3):
+            response = self.client.get("/orders?limit=50", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(len(json_response["results"]), 50)
+        self.assertEqual(len(json_response["results"][49]["lineitems"]), 3)
+
+        with self.assertNumQueries(3):
+            response = self.client.get(f"/orders?limit=50&payment_id={payment.id}", None, format='json')
+        self.assertEqual(len(json.loads(response.content)["results"]), 50)
+
+        with self.assertNumQueries(3):
+            response = self.client.get("/orders/50", None, format='json')
+        self.assertEqual(len(json.loads(response.content)["lineitems"]), 3)
+
+    def test_export_orders_and_products(self):
+        """
+        Ensure tables are exported in full, or only rows changed since a point in time.
+        """
+        self.test_add_product_to_order()
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+
+        call_command("export", "--output-dir", directory, "--gzip", stdout=io.StringIO())
+        with gzip.open(f"{directory}/orderproduct.ndjson.gz", "rt", encoding="utf-8") as file:
+            line_items = [json.loads(line) for line in file]
+        self.assertEqual(len(line_items), 1)
+        self.assertEqual(line_items[0]["product_id"], 1)
+
+        call_command("export", "product", "--output-dir", directory, "--format", "csv", stdout=io.StringIO())
+        with open(f"{directory}/product.csv", encoding="utf-8") as file:
+            lines = file.read().splitlines()
+        self.assertTrue(lines[0].startswith("id,"))
+        self.assertEqual(len(lines), 2)
+
+        since = (timezone.now() + datetime.timedelta(minutes=1)).isoformat()
+        call_command("export", "order", "--output-dir", directory, "--since", since, stdout=io.StringIO())
+        with open(f"{directory}/order.ndjson", encoding="utf-8") as file:
+            self.assertEqual(file.read(), "")
+
+
+    # TODO: New line item is not added to closed order
+
+
+class CheckoutConcurrencyTests(TransactionTestCase):
+    """Checkouts racing on their own database connections"""
+
+    def setUp(self) -> None:
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        self.orders = []
+        for number in range(2):
+            user = User.objects.create_user(username=f"buyer{number}", password="Admin8*")
+            customer = Customer.objects.create(user=user, phone_number="555-1212", address="1 Main St")
+            if number == 0:
+                self.product = Product.objects.create(
+                    name="Kite", price=14.99, quantity=1, description="It flies high",
+                    category=category, customer=customer, location="Pittsburgh")
+            payment = Payment.objects.create(
+                merchant_name="Visa", account_number="1111-2222", customer=customer,
+                expiration_date="2030-01-01", create_date="2024-01-01")
+            order = Order.objects.create(customer=customer, created_date=datetime.date.today())
+            OrderProduct.objects.add_to_order(order, self.product)
+            self.orders.append((order.pk, payment.pk))
+
+    def test_concurrent_checkouts_of_the_last_unit(self):
+        """
+        Ensure only one of two simultaneous checkouts gets the last unit.
+        """
+        barrier = threading.Barrier(len(self.orders))
+        outcomes = []
+
+        def checkout(order_id, payment_id):
+            try:
+                order = Order.objects.get(pk=order_id)
+                payment = Payment.objects.get(pk=payment_id)
+                barrier.wait()
+                order.checkout(payment)
+                outcomes.append("paid")
+            except OutOfStock:
+                outcomes.append("short")
+            except Exception as ex:  # pylint: disable=broad-except
+                outcomes.append(repr(ex))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=checkout, args=args) for args in self.orders]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
 
-    # TODO: New line item is not added to closed order
\ No newline at end of file
+        self.assertEqual(sorted(outcomes), ["paid", "short"])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.quantity, 0)
+        self.assertEqual(self.product.units_sold, 1)
+        self.assertEqual(Order.objects.filter(payment_type__isnull=False).count(), 1)
@@ -1,7 +1,22 @@
+import base64
+import io
 import json
+import os
 import datetime
+import tempfile
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
 from rest_framework import status
 from rest_framework.test import APITestCase
+from safedelete.config import HARD_DELETE
+from bangazonapi.images import refresh_variants, variant_name
+from bangazonapi.models import Order, Product, ProductTrendScore, TableVersion
 
 
 class ProductTests(APITestCase):
@@ -93,7 +108,537 @@ class ProductTests(APITestCase):
         response = self.client.get(url, None, format='json')
         json_response = json.loads(response.content)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(json_response), 3)
+        self.assertEqual(len(json_response["results"]), 3)
+        self.assertIsNone(json_response["next"])
+
+    def test_page_through_products_with_cursor(self):
+        """
+        Ensure the product list can be walked forwards and backwards by cursor.
+        """
+        for _ in range(5):
+            self.test_create_product()
+
+        response = self.client.get("/products?limit=2", None, format='json')
+        first_page = json.loads(response.content)
+        self.assertEqual([p["id"] for p in first_page["results"]], [1, 2])
+        self.assertIsNone(first_page["previous"])
+
+        response = self.client.get(first_page["next"], None, format='json')
+        second_page = json.loads(response.content)
+        self.assertEqual([p["id"] for p in second_page["results"]], [3, 4])
+
+        response = self.client.get(second_page["previous"], None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual([p["id"] for p in json_response["results"]], [1, 2])
+        self.assertIsNone(json_response["previous"])
+
+        response = self.client.get("/products?quantity=2", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual([p["id"] for p in json_response["results"]], [5, 4])
+
+        response = self.client.get("/products?cursor=garbage", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+        for url in ("/products?quantity=0", "/products?limit=0", "/products?limit=-1", "/orders?limit=x"):
+            response = self.client.get(url, None, format='json')
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, url)
+
+    def test_unrated_product_has_zero_average_rating(self):
+        """
+        Ensure products without ratings or sales report zeroes.
+        """
+        self.test_create_product()
+
+        response = self.client.get("/products/1", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["average_rating"], 0)
+        self.assertEqual(json_response["number_sold"], 0)
+
+        response = self.client.get("/products?order_by=number_sold", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_filter_products_by_number_sold(self):
+        """
+        Ensure products can be filtered by how many have been sold.
+        """
+        self.test_create_product()
+        self.test_create_product()
+
+        response = self.client.get("/products?number_sold=0&category=1", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(response.content)["results"]), 2)
+
+        response = self.client.get("/products?min_sold=1", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(json.loads(response.content)["results"]), 0)
+
+        response = self.client.get("/products?max_sold=lots", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_filter_products_by_price_location_and_seller(self):
+        """
+        Ensure the listing filters combine with each other and with sorting.
+        """
+        self.test_create_product()
+        kite = {"name": "Tennis Racket", "price": 80, "quantity": 4, "description": "Graphite",
+                "category_id": 1, "location": "Nashville"}
+        self.client.post("/products", kite, format='json')
+
+        response = self.client.get("/products?min_price=10&max_price=50&location=Pittsburgh&seller=1")
+        self.assertEqual([product["name"] for product in json.loads(response.content)["results"]], ["Kite"])
+
+        today = timezone.localdate().isoformat()
+        response = self.client.get(f"/products?created_after={today}&order_by=price&direction=desc")
+        self.assertEqual([product["name"] for product in json.loads(response.content)["results"]],
+                         ["Tennis Racket", "Kite"])
+
+        response = self.client.get("/products?seller=2")
+        self.assertEqual(json.loads(response.content)["results"], [])
+
+        response = self.client.get("/products?min_price=50&max_price=10")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn("max_price", json.loads(response.content)["message"])
+
+        response = self.client.get("/products?created_after=yesterday")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_product_facets(self):
+        """
+        Ensure filter counts are computed for categories, prices and locations.
+        """
+        self.test_create_product()
+        self.test_create_product()
+        racket = {"name": "Tennis Racket", "price": 80, "quantity": 4, "description": "Graphite",
+                  "category_id": 1, "location": "Nashville"}
+        self.client.post("/products", racket, format='json')
+
+        response = self.client.get("/products/facets?location=Pittsburgh")
+        json_response = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json_response["count"], 2)
+        self.assertEqual(json_response["categories"], [{"id": 1, "name": "Sporting Goods", "count": 2}])
+        self.assertEqual({bucket["min"]: bucket["count"] for bucket in json_response["prices"]}[10], 2)
+        self.assertEqual(json_response["prices"][-1], {"min": 1000, "max": None, "count": 0})
+        # The location facet ignores the location filter
+        self.assertEqual(json_response["locations"], [{"location": "Pittsburgh", "count": 2},
+                                                      {"location": "Nashville", "count": 1}])
+
+        response = self.client.get("/products/facets?q=racket")
+        self.assertEqual(json.loads(response.content)["count"], 1)
+
+    def test_search_products(self):
+        """
+        Ensure products can be found by words in their name or description.
+        """
+        self.test_create_product()
+
+        url = "/products"
+        data = {"name": "Tennis Racket", "price": 80, "quantity": 5, "description": "Strings included, unlike a kite",
+                "category_id": 1, "location": "Nashville"}
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        self.client.post(url, data, format='json')
+
+        response = self.client.get("/products?q=racket", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([p["name"] for p in json_response["results"]], ["Tennis Racket"])
+
+        # The name match ranks above the description-only match
+        response = self.client.get("/products?q=kit&category=1", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual([p["name"] for p in json_response["results"]], ["Kite", "Tennis Racket"])
+
+        self.client.delete("/products/2")
+        response = self.client.get("/products?q=racket", None, format='json')
+        self.assertEqual(len(json.loads(response.content)["results"]), 0)
+
+        # Queries without any searchable words match nothing
+        for query in ("", "%22%2A-%28%29"):
+            response = self.client.get(f"/products?q={query}", None, format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(json.loads(response.content)["results"], [])
+        response = self.client.get("/products?stream=1&q=")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(json.loads(b"".join(response.streaming_content)), [])
+
+    def test_conditional_get_products(self):
+        """
+        Ensure unchanged products are answered with 304 Not Modified.
+        """
+        self.test_create_product()
+
+        for url in ("/products/1", "/products?limit=5", "/productcategories"):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(response.has_header("ETag"))
+            self.assertTrue(response.has_header("Last-Modified"))
+
+            etag = response["ETag"]
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        # JSON and NDJSON representations of a URL have different tags
+        for url in ("/products/1", "/products?limit=5"):
+            response = self.client.get(url)
+            self.assertIn("Accept", response["Vary"])
+            response = self.client.get(
+                url, HTTP_IF_NONE_MATCH=response["ETag"], HTTP_ACCEPT="application/x-ndjson")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.get(url, HTTP_ACCEPT="application/x-ndjson")
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=response["ETag"])
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        etag = self.client.get("/products/1")["ETag"]
+        self.test_update_product()
+        response = self.client.get("/products/1", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_category_list_counts_products(self):
+        """
+        Ensure the cached category list is refreshed when products and categories change.
+        """
+        response = self.client.get("/productcategories")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response[0]["product_count"], 0)
+
+        self.test_create_product()
+        self.client.post("/productcategories", {"name": "Outdoors"}, format='json')
+
+        response = self.client.get("/productcategories")
+        json_response = json.loads(response.content)
+        self.assertEqual([c["product_count"] for c in json_response], [1, 0])
+        self.assertEqual(json_response[1]["name"], "Outdoors")
+        etag = response["ETag"]
+
+        # Another process's cache has no hook to be invalidated, only the table version moves
+        cache.clear()
+        self.client.get("/productcategories")
+        Product.all_objects.filter(pk=1).update(category_id=2)
+        TableVersion.bump('productcategory')
+        response = self.client.get("/productcategories", HTTP_IF_NONE_MATCH=etag)
+        json_response = json.loads(response.content)
+        self.assertEqual([c["product_count"] for c in json_response], [0, 1])
+
+        # Writes that leave the product counts alone keep the list current
+        etag = response["ETag"]
+        self.client.put("/products/1", {"name": "Kite", "price": 20, "description": "It flies high",
+                                        "quantity": 5, "location": "Pittsburgh", "category_id": 2,
+                                        "created_date": "2024-01-01"},
+                        format='json')
+        response = self.client.get("/productcategories", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_sparse_product_fieldsets(self):
+        """
+        Ensure clients can choose which product fields are returned.
+        """
+        self.test_create_product()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get("/products?fields=id,name,price,image_path", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertEqual(list(json_response["results"][0].keys()), ["id", "name", "price", "image_path"])
+        product_queries = [q["sql"] for q in queries if '"bangazonapi_product"."name"' in q["sql"]]
+        self.assertEqual(len(product_queries), 1)
+        self.assertNotIn("number_sold", product_queries[0])
+        self.assertNotIn("average_rating", product_queries[0])
+
+        # Sorting on a stat still computes it
+        response = self.client.get("/products?fields=id,name&order_by=average_rating", None, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(list(json.loads(response.content)["results"][0].keys()), ["id", "name"])
+
+        response = self.client.get("/products/1?exclude=description,average_rating", None, format='json')
+        json_response = json.loads(response.content)
+        self.assertNotIn("description", json_response)
+        self.assertNotIn("average_rating", json_response)
+        self.assertEqual(json_response["number_sold"], 0)
+
+    def test_stream_products(self):
+        """
+        Ensure the whole product list can be streamed as JSON or NDJSON.
+        """
+        for _ in range(3):
+            self.test_create_product()
+
+        response = self.client.get("/products?stream=1&limit=1")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        json_response = json.loads(b"".join(response.streaming_content))
+        self.assertEqual([p["id"] for p in json_response], [1, 2, 3])
+
+        response = self.client.get("/products?fields=id,name", HTTP_ACCEPT="application/x-ndjson")
+        self.assertEqual(response["Content-Type"], "application/x-ndjson; charset=utf-8")
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual([json.loads(line) for line in lines],
+                         [{"id": i, "name": "Kite"} for i in (1, 2, 3)])
+
+    def test_bulk_create_products(self):
+        """
+        Ensure many products can be created at once, with per-item errors.
+        """
+        kite = {"name": "Kite", "price": 14.99, "quantity": 60, "description": "It flies high",
+                "category_id": 1, "location": "Pittsburgh"}
+        data = [kite, dict(kite, price=-1), dict(kite, category_id=99),
+                dict(kite, image_path="products/missing.png"), dict(kite, name="Tennis Racket")]
+
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        response = self.client.post("/products/bulk", data, format='json')
+        json_response = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json_response["created"], 2)
+        self.assertEqual(json_response["failed"], 3)
+        self.assertEqual(json_response["results"][0], {"index": 0, "id": 1})
+        self.assertIn("price", json_response["results"][1]["errors"])
+        self.assertIn("category_id", json_response["results"][2]["errors"])
+        self.assertIn("image_path", json_response["results"][3]["errors"])
+        self.assertEqual(json_response["results"][4], {"index": 4, "id": 2})
+
+        response = self.client.get("/products?q=racket")
+        self.assertEqual(len(json.loads(response.content)["results"]), 1)
+
+        body = "\n".join(json.dumps(dict(kite, name=f"Kite {i}")) for i in range(3))
+        response = self.client.post("/products/bulk", body, content_type="application/x-ndjson")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json.loads(response.content)["created"], 3)
+
+    @override_settings(PRODUCT_IMAGE_WORKERS=0)
+    def test_create_product_with_image(self):
+        """
+        Ensure an uploaded image is processed after the product is created.
+        """
+        self._use_temporary_media_root()
+        data = {"name": "Kite", "price": 14.99, "quantity": 60, "description": "It flies high",
+                "category_id": 1, "location": "Pittsburgh", "image_path": self._image_data_uri()}
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post("/products", data, format='json')
+        json_response = json.loads(response.content)
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(json_response["image_status"], "pending")
+
+        response = self.client.get(f"/products/{json_response['id']}")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["image_status"], "ready")
+        self.assertRegex(json_response["image_path"], r"/products/[0-9a-f]{64}\.png$")
+        name = Product.objects.get(pk=json_response["id"]).image_path.name
+        self.assertEqual(set(json_response["image_variants"]), {"128", "256", "512"})
+        self.assertTrue(json_response["image_variants"]["256"].endswith("/" + variant_name(name, 256)))
+
+        # Reads list the recorded variants without looking at storage
+        default_storage.delete(variant_name(name, 128))
+        Product.objects.filter(pk=json_response["id"]).update(image_variant_sizes=[256, 512])
+        response = self.client.get(f"/products/{json_response['id']}")
+        self.assertEqual(set(json.loads(response.content)["image_variants"]), {"256", "512"})
+
+        # The backfill restores the variant and invalidates cached reads
+        etag = response["ETag"]
+        call_command("generate_product_image_variants", stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(variant_name(name, 128)))
+        response = self.client.get(f"/products/{json_response['id']}", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(set(json.loads(response.content)["image_variants"]), {"128", "256", "512"})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                "/products", dict(data, image_path="data:image/png;base64,bm90IGFuIGltYWdl"), format='json')
+        response = self.client.get(f"/products/{json.loads(response.content)['id']}")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["image_status"], "failed")
+        self.assertEqual(json_response["image_error"], "The upload is not a readable image")
+
+        response = self.client.post("/products", dict(data, image_path="kite.png"), format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        # The image job of an upload whose process died never runs
+        response = self.client.post("/products", data, format='json')
+        product_id = json.loads(response.content)["id"]
+        call_command("fail_stale_product_images", stdout=io.StringIO())
+        self.assertEqual(Product.objects.get(pk=product_id).image_status, "pending")
+        call_command("fail_stale_product_images", older_than_minutes=0, stdout=io.StringIO())
+        response = self.client.get(f"/products/{product_id}")
+        json_response = json.loads(response.content)
+        self.assertEqual(json_response["image_status"], "failed")
+        self.assertEqual(json_response["image_error"], "Processing was interrupted, upload the image again")
+
+    @override_settings(PRODUCT_IMAGE_WORKERS=0)
+    def test_identical_images_share_one_file(self):
+        """
+        Ensure identical uploads are stored once, and collected once unreferenced.
+        """
+        self._use_temporary_media_root()
+        data = {"name": "Kite", "price": 14.99, "quantity": 60, "description": "It flies high",
+                "category_id": 1, "location": "Pittsburgh", "image_path": self._image_data_uri()}
+        self.client.credentials(HTTP_AUTHORIZATION='Token ' + self.token)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/products", data, format='json')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/products", dict(data, name="Kite string"), format='json')
+
+        first, second = Product.objects.order_by("id")
+        self.assertEqual(first.image_path.name, second.image_path.name)
+        self.assertEqual(len(default_storage.listdir("products")[1]), 1)
+
+        # Soft-deleted products still reference their image
+        first.delete()
+        Product.all_objects.filter(pk=second.pk).delete(force_policy=HARD_DELETE)
+        call_command("collect_product_images", grace_minutes=0, stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(first.image_path.name))
+
+        Product.all_objects.filter(pk=first.pk).delete(force_policy=HARD_DELETE)
+        call_command("collect_product_images", grace_minutes=0, stdout=io.StringIO())
+        self.assertEqual(default_storage.listdir("products")[1], [])
+        self.assertEqual(default_storage.listdir("products/variants")[1], [])
+
+        # Reusing an old file restarts its grace period
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/products", data, format='json')
+        name = Product.objects.get().image_path.name
+        hours_ago = (timezone.now() - datetime.timedelta(hours=2)).timestamp()
+        os.utime(default_storage.path(name), (hours_ago, hours_ago))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post("/products", dict(data, name="Kite string"), format='json')
+        self.assertGreater(default_storage.get_modified_time(name),
+                           timezone.now() - datetime.timedelta(minutes=1))
+
+    @override_settings(PRODUCT_IMAGE_WORKERS=0)
+    def test_images_with_the_same_file_name_have_their_own_variants(self):
+        """
+        Ensure images in different directories with the same file name stem do not share variants.
+        """
+        self.test_create_product()
+        self.test_create_product()
+        with tempfile.TemporaryDirectory() as media_root, self.settings(MEDIA_ROOT=media_root):
+            names = ("products/a/x.png", "products/b/x.jpg")
+            for name, size, image_format in zip(names, ((300, 200), (200, 300)), ("PNG", "JPEG")):
+                output = io.BytesIO()
+                Image.new("RGB", size, "red").save(output, format=image_format)
+                default_storage.save(name, io.BytesIO(output.getvalue()))
+            for pk, name in zip((1, 2), names):
+                Product.objects.filter(pk=pk).update(image_path=name)
+                refresh_variants(name, overwrite=False)
+
+            self.assertNotEqual(variant_name(names[0], 256), variant_name(names[1], 256))
+            for name, size in zip(names, ((256, 171), (171, 256))):
+                with default_storage.open(variant_name(name, 256)) as file, Image.open(file) as image:
+                    self.assertEqual(image.size, size)
+
+            # Collecting one image's variants leaves the other's alone
+            Product.all_objects.filter(pk=1).delete(force_policy=HARD_DELETE)
+            default_storage.delete(names[0])
+            call_command("collect_product_images", grace_minutes=0, stdout=io.StringIO())
+            self.assertFalse(default_storage.exists(variant_name(names[0], 256)))
+            self.assertTrue(default_storage.exists(variant_name(names[1], 256)))
+
+    def test_import_products(self):
+        """
+        Ensure products stream in from CSV and NDJSON files, rejecting bad rows.
+        """
+        directory = self.enterContext(tempfile.TemporaryDirectory())
+        with open(f"{directory}/products.csv", "w", encoding="utf-8") as file:
+            file.write("name,price,description,quantity,location,category_id,customer_id\n"
+                       "Kite,14.99,It flies high,60,Pittsburgh,1,1\n"
+                       "Kite string,-1,100 yards,60,Pittsburgh,1,1\n"
+                       "Tennis Racket,80,Graphite,4,Nashville,99,1\n")
+        with open(f"{directory}/products.ndjson", "w", encoding="utf-8") as file:
+            file.write(json.dumps({"name": "Goggles", "price": 20, "description": "Anti fog", "quantity": 3,
+                                   "location": "Boston", "category": "sporting goods", "customer": "steve"}))
+            file.write("\n{not json\n")
+
+        output = io.StringIO()
+        call_command("import_products", f"{directory}/products.csv", "--batch-size", "1",
+                     "--rejects", f"{directory}/rejects.ndjson", stdout=output)
+        self.assertIn("Imported 1 products, rejected 2 rows", output.getvalue())
+        with open(f"{directory}/rejects.ndjson", encoding="utf-8") as file:
+            rejects = [json.loads(line) for line in file]
+        self.assertEqual([reject["line"] for reject in rejects], [3, 4])
+        self.assertIn("price", rejects[0]["errors"])
+        self.assertIn("category", rejects[1]["errors"])
+
+        output = io.StringIO()
+        call_command("import_products", f"{directory}/products.ndjson", stdout=output, stderr=io.StringIO())
+        self.assertIn("Imported 1 products, rejected 1 rows", output.getvalue())
+
+        response = self.client.get("/products?q=goggles")
+        self.assertEqual(len(json.loads(response.content)["results"]), 1)
+
+    def test_top_and_trending_products(self):
+        """
+        Ensure the materialized rankings list paid products, best first.
+        """
+        self.test_create_product()
+        self.test_create_product()
+        for product_id in (2, 2, 1):
+            self.client.post("/cart", {"product_id": product_id}, format='json')
+
+        data = {"merchant_name": "Visa", "account_number": "1111-2222",
+                "expiration_date": "2030-01-01", "create_date": "2024-01-01"}
+        response = self.client.post("/paymenttypes", data, format='json')
+        self.client.put("/orders/1", {"payment_type": json.loads(response.content)["id"]}, format='json')
+
+        call_command("refresh_product_rankings", stdout=io.StringIO())
+
+        response = self.client.get("/products/top?fields=id,number_sold")
+        json_response = json.loads(response.content)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([(row["rank"], row["product"]) for row in json_response["results"]],
+                         [(1, {"id": 2, "number_sold": 2}), (2, {"id": 1, "number_sold": 1})])
+
+        response = self.client.get("/products/trending?category=1&limit=1")
+        json_response = json.loads(response.content)
+        self.assertEqual(len(json_response["results"]), 1)
+        self.assertEqual(json_response["results"][0]["product"]["id"], 2)
+        self.assertAlmostEqual(json_response["results"][0]["score"], 2, places=2)
+
+        response = self.client.get("/products/trending?category=2")
+        self.assertEqual(json.loads(response.content)["results"], [])
+
+    def test_trending_counts_late_commits_and_unpaid_orders(self):
+        """
+        Ensure orders stamped paid before a refresh but committed after it are counted, and unpaid ones taken back.
+        """
+        self.test_create_product()
+        self.test_create_product()
+        data = {"merchant_name": "Visa", "account_number": "1111-2222",
+                "expiration_date": "2030-01-01", "create_date": "2024-01-01"}
+        response = self.client.post("/paymenttypes", data, format='json')
+        payment = {"payment_type": json.loads(response.content)["id"]}
+        half_life = datetime.timedelta(hours=72)
+        minute = datetime.timedelta(minutes=1)
+
+        self.client.post("/cart", {"product_id": 2}, format='json')
+        self.client.put("/orders/1", payment, format='json')
+        started = timezone.now()
+        self.assertEqual(ProductTrendScore.refresh(half_life, now=started), 1)
+
+        # Paid, and stamped, while the refresh was running
+        self.client.post("/cart", {"product_id": 1, "quantity": 2}, format='json')
+        self.client.put("/orders/2", payment, format='json')
+        Order.objects.filter(pk=2).update(paid_date=started - minute)
+
+        for later in (1, 2):
+            self.assertEqual(ProductTrendScore.refresh(half_life, now=started + later * minute), 2)
+            self.assertAlmostEqual(ProductTrendScore.objects.get(pk=1).score, 2, places=2)
+
+        order = Order.objects.get(pk=2)
+        order.payment_type = None
+        order.save()
+        self.assertEqual(ProductTrendScore.refresh(half_life, now=started + 3 * minute), 1)
+        self.assertFalse(ProductTrendScore.objects.filter(pk=1).exists())
+
+    def _use_temporary_media_root(self):
+        """Point MEDIA_ROOT at a directory that is removed after the test"""
+        media_root = self.enterContext(tempfile.TemporaryDirectory())
+        self.enterContext(self.settings(MEDIA_ROOT=media_root))
+
+    def _image_data_uri(self):
+        output = io.BytesIO()
+        Image.new("RGB", (4, 4), "red").save(output, format="PNG")
+        return "data:image/png;base64," + base64.b64encode(output.getvalue()).decode()
 
     # TODO: Delete product
 
@@ -0,0 +1,72 @@
+import io
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from bangazonapi.models import Customer, Order, OrderProduct, Payment, Product, ProductCategory
+
+
+class QueryPlanTests(TestCase):
+    """
+    Ensure the hot queries are answered from their indexes, not table scans
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Load enough products, then gather planner statistics like seed_data.sh does
+        """
+        user = User.objects.create_user(username="steve", password="Admin8*")
+        customer = Customer.objects.create(user=user, phone_number="555-1212", address="100 Infinity Way")
+        category = ProductCategory.objects.create(name="Sporting Goods")
+        Product.objects.bulk_create(
+            Product(name=f"Kite {i}", price=14.99, description="It flies high", quantity=60,
+                    location="Pittsburgh", customer=customer, category=category)
+            for i in range(50))
+        call_command("analyze_db", stdout=io.StringIO())
+
+    def assertUsesIndex(self, queryset, index_name):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on sqlite only')
+        plan = queryset.explain()
+        self.assertIn(f'INDEX {index_name}', plan)
+
+    def test_open_order_lookup_uses_index(self):
+        self.assertUsesIndex(
+            Order.objects.filter(customer_id=1, payment_type=None), 'order_open_by_customer_idx')
+
+    def test_customer_orders_use_index(self):
+        self.assertUsesIndex(
+            Order.objects.filter(customer_id=1).order_by('created_date', 'id'),
+            'order_customer_created_idx')
+
+    def test_line_item_lookup_uses_index(self):
+        # Served by the index behind the one-line-item-per-product constraint
+        if connection.vendor != 'sqlite':
+            self.skipTest('Query plans are checked on sqlite only')
+        plan = OrderProduct.objects.filter(product_id=1, order_id=1).explain()
+        self.assertIn('USING INDEX', plan)
+        self.assertIn('order_id=? AND product_id=?', plan)
+
+    def test_product_listing_uses_index(self):
+        self.assertUsesIndex(
+            Product.objects.order_by('created_date', 'id'), 'product_live_created_idx')
+        self.assertUsesIndex(
+            Product.objects.filter(category_id=1).order_by('created_date', 'id'),
+            'product_live_category_idx')
+
+    def test_product_filters_use_indexes(self):
+        self.assertUsesIndex(
+            Product.objects.filter(price__gte=10, price__lte=20).order_by('price', 'id'),
+            'product_live_price_idx')
+        self.assertUsesIndex(
+            Product.objects.filter(location='Pittsburgh').order_by('created_date', 'id'),
+            'product_live_location_idx')
+        self.assertUsesIndex(
+            Product.objects.filter(customer_id=1).order_by('created_date', 'id'),
+            'product_live_seller_idx')
+
+    def test_customer_payment_types_use_index(self):
+        self.assertUsesIndex(
+            Payment.objects.filter(customer_id=1).order_by('create_date', 'id'),
+            'payment_live_by_customer_idx')